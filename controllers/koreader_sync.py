@@ -1,58 +1,156 @@
 """KoReader sync storage and HTTP controller."""
 import json
+import math
 import os
 import sqlite3
 import base64
+import contextlib
+import threading
 import time
 
+from controllers.cache import TTLCache
+
 KOREADER_SYNC_DB_PATH = os.environ.get('KOREADER_SYNC_DB_PATH', 'koreader_sync.db')
 
+# Built once: json.dumps() would construct a new encoder on every call
+# because ensure_ascii differs from the default.
+_json_encode = json.JSONEncoder(ensure_ascii=False).encode
+_b64decode = base64.b64decode
+
+VERIFIED_USERS_CACHE_SIZE = 1024
+# Bounds how long a credential removed directly from the database keeps working.
+VERIFIED_USERS_CACHE_TTL = 300
+# KoReader progress payloads are a few hundred bytes; anything beyond this
+# is rejected before the body is read.
+MAX_JSON_BODY_SIZE = 64 * 1024
+# Client-supplied timestamps further in the future than this are clamped.
+MAX_CLIENT_CLOCK_SKEW = 3600
+
+# SQL statements are kept as module constants so every call passes the same
+# string object and hits sqlite3's prepared-statement cache.
+_SQL_CREATE_USER = 'INSERT INTO users (username, password_md5) VALUES (?, ?)'
+_SQL_VERIFY_USER = 'SELECT 1 FROM users WHERE username = ? AND password_md5 = ?'
+_SQL_UPSERT = """
+    INSERT INTO sync_records (user, document, percentage, progress, device, device_id, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user, document) DO UPDATE SET
+        percentage = excluded.percentage,
+        progress = excluded.progress,
+        device = excluded.device,
+        device_id = excluded.device_id,
+        timestamp = excluded.timestamp
+"""
+# (user, document) is the primary key, so document lookups hit at most one
+# row and need no ORDER BY.
+_PROGRESS_FIELDS = ('percentage', 'progress', 'device', 'device_id', 'timestamp')
+_SQL_FETCH_LATEST = (
+    f'SELECT {", ".join(_PROGRESS_FIELDS)} FROM sync_records '
+    'WHERE user = ? AND document = ?'
+)
+
+
+def _is_valid_field(field):
+    """Check if field is a non-empty string."""
+    return type(field) is str and field != ''
+
+
+def _is_valid_key_field(field):
+    """Check if field is a non-empty string without colons."""
+    return type(field) is str and field != '' and ':' not in field
+
+
 class KoReaderSyncStorage:
-    def _ensure_user_table(self):
-        with self._get_connection() as conn:
-            conn.execute(
-                '''
-                CREATE TABLE IF NOT EXISTS users (
-                    username TEXT PRIMARY KEY,
-                    password_md5 TEXT NOT NULL
-                )
-                '''
-            )
+    """SQLite-backed storage for KoReader sync progress."""
+
+    def __init__(self, db_path=KOREADER_SYNC_DB_PATH):
+        self.db_path = db_path
+        # One long-lived connection shared by every request thread; access
+        # is serialized by the lock since sqlite3 connections are not
+        # safe for concurrent use.
+        self._conn = sqlite3.connect(
+            db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=256,
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._configure_connection(self._conn)
+        self._lock = threading.Lock()
+        # username -> password_md5 pairs already verified against the
+        # users table, so polling devices skip the SELECT.
+        self._verified_users = TTLCache(maxsize=VERIFIED_USERS_CACHE_SIZE, ttl=VERIFIED_USERS_CACHE_TTL)
+        self._ensure_tables()
+
+    @staticmethod
+    def _configure_connection(conn):
+        """Apply performance PRAGMAs to a freshly opened connection.
+
+        WAL lets readers proceed while a write is in progress, and
+        synchronous=NORMAL is safe in WAL mode while avoiding an fsync
+        on every commit.
+        """
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-64000')
+        conn.execute('PRAGMA mmap_size=134217728')
+
+    @contextlib.contextmanager
+    def _get_connection(self):
+        """Yield the shared connection while holding the storage lock."""
+        with self._lock:
+            yield self._conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Yield the shared connection inside an explicit write transaction.
+
+        The connection runs in autocommit mode, so reads need no wrapper;
+        writes take the write lock up front with BEGIN IMMEDIATE and are
+        rolled back if the block or the COMMIT raises, so the shared
+        connection is never left inside an open transaction.
+        """
+        with self._lock:
+            conn = self._conn
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
 
     def create_user(self, username, password_md5):
-        self._ensure_user_table()
         try:
-            with self._get_connection() as conn:
-                conn.execute(
-                    'INSERT INTO users (username, password_md5) VALUES (?, ?)',
-                    (username, password_md5)
-                )
+            with self._transaction() as conn:
+                conn.execute(_SQL_CREATE_USER, (username, password_md5))
+            self._verified_users.pop(username, None)
             return True
         except sqlite3.IntegrityError:
             return False
 
     def verify_user(self, username, password_md5):
-        self._ensure_user_table()
+        if self._verified_users.get(username) == password_md5:
+            return True
         with self._get_connection() as conn:
-            row = conn.execute(
-                'SELECT 1 FROM users WHERE username = ? AND password_md5 = ?',
-                (username, password_md5)
-            ).fetchone()
-        return row is not None
-
-    """SQLite-backed storage for KoReader sync progress."""
-
-    def __init__(self, db_path=KOREADER_SYNC_DB_PATH):
-        self.db_path = db_path
-        self._ensure_tables()
-
-    def _get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+            row = conn.execute(_SQL_VERIFY_USER, (username, password_md5)).fetchone()
+        if row is None:
+            return False
+        self._verified_users.set(username, password_md5)
+        return True
 
     def _ensure_tables(self):
-        with self._get_connection() as conn:
+        """Create the schema once, in a single transaction, at startup."""
+        with self._transaction() as conn:
+            conn.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS users (
+                    username TEXT PRIMARY KEY,
+                    password_md5 TEXT NOT NULL
+                )
+                '''
+            )
             conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS sync_records (
@@ -67,28 +165,27 @@ class KoReaderSyncStorage:
                 )
                 """
             )
+            # Progress lookups go through the (user, document) primary key.
+            # Databases created by earlier versions carry a (user, timestamp)
+            # index that no query reads but every upsert has to maintain.
+            conn.execute('DROP INDEX IF EXISTS idx_sync_user_ts')
 
     def upsert_record(self, user, document, percentage, progress, device, device_id, timestamp):
-        with self._get_connection() as conn:
+        with self._transaction() as conn:
             conn.execute(
-                """
-                INSERT OR REPLACE INTO sync_records (user, document, percentage, progress, device, device_id, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
+                _SQL_UPSERT,
                 (user, document, percentage, progress, device, device_id, timestamp),
             )
 
-    def fetch_records(self, user, document=None):
-        if document:
-            query = "SELECT * FROM sync_records WHERE user = ? AND document = ?"
-            params = (user, document)
-        else:
-            query = "SELECT * FROM sync_records WHERE user = ?"
-            params = (user,)
-        query += " ORDER BY timestamp ASC"
+    def upsert_many(self, rows):
+        """Upsert several (user, document, ...) rows in one transaction."""
+        with self._transaction() as conn:
+            conn.executemany(_SQL_UPSERT, rows)
+
+    def fetch_latest_record(self, user, document):
+        """Return the progress row for a document, or None if there is none."""
         with self._get_connection() as conn:
-            rows = conn.execute(query, params).fetchall()
-        return [dict(row) for row in rows]
+            return conn.execute(_SQL_FETCH_LATEST, (user, document)).fetchone()
 
 
 class KoReaderSyncController:
@@ -102,18 +199,11 @@ class KoReaderSyncController:
     _sync_storage_instance = None
 
     def __init__(self, request_handler):
-        if KoReaderSyncController._sync_storage_instance is None:
-            KoReaderSyncController._sync_storage_instance = KoReaderSyncStorage()
+        storage = KoReaderSyncController._sync_storage_instance
+        if storage is None:
+            storage = KoReaderSyncController._sync_storage_instance = KoReaderSyncStorage()
         self.request = request_handler
-        self.sync_storage = KoReaderSyncController._sync_storage_instance
-
-    def _is_valid_field(self, field):
-        """Check if field is a non-empty string."""
-        return isinstance(field, str) and len(field) > 0
-
-    def _is_valid_key_field(self, field):
-        """Check if field is a non-empty string without colons."""
-        return self._is_valid_field(field) and ":" not in field
+        self.sync_storage = storage
 
     def register(self):
         payload = self._parse_json_body()
@@ -122,7 +212,7 @@ class KoReaderSyncController:
 
         username = payload.get('username')
         password_md5 = payload.get('password')
-        if not self._is_valid_key_field(username) or not self._is_valid_field(password_md5):
+        if not _is_valid_key_field(username) or not _is_valid_field(password_md5):
             self._send_json_error(self.ERROR_INVALID_FIELDS, 'Invalid username or password')
             return
 
@@ -133,9 +223,10 @@ class KoReaderSyncController:
             self._send_json_error(self.ERROR_USER_EXISTS, 'User already exists')
 
     def login(self):
-        user = self.request.headers.get('X-Auth-User')
-        password_md5 = self.request.headers.get('X-Auth-Key')
-        if not self._is_valid_key_field(user) or not self._is_valid_field(password_md5):
+        get_header = self.request.headers.get
+        user = get_header('X-Auth-User')
+        password_md5 = get_header('X-Auth-Key')
+        if not _is_valid_key_field(user) or not _is_valid_field(password_md5):
             self._send_json_error(self.ERROR_INVALID_FIELDS, 'Invalid X-Auth-User or X-Auth-Key')
             return
 
@@ -156,31 +247,21 @@ class KoReaderSyncController:
             self._send_json_error(self.ERROR_DOCUMENT_FIELD_MISSING, 'Missing document parameter')
             return
 
-        if not self._is_valid_key_field(document):
+        if not _is_valid_key_field(document):
             self._send_json_error(self.ERROR_DOCUMENT_FIELD_MISSING, 'Invalid document parameter')
             return
 
-        records = self.sync_storage.fetch_records(
-            user=user,
-            document=document,
-        )
+        row = self.sync_storage.fetch_latest_record(user, document)
 
-        if not records:
+        if row is None:
             self._send_json_response({})
             return
 
-        row = records[0]
-        res = {}
-        if row['percentage'] is not None:
-            res['percentage'] = row['percentage']
-        if row['progress'] is not None:
-            res['progress'] = row['progress']
-        if row['device'] is not None:
-            res['device'] = row['device']
-        if row['device_id'] is not None:
-            res['device_id'] = row['device_id']
-        if row['timestamp'] is not None:
-            res['timestamp'] = row['timestamp']
+        res = {
+            field: value
+            for field, value in zip(_PROGRESS_FIELDS, row)
+            if value is not None
+        }
         if res:
             res['document'] = document
 
@@ -197,36 +278,81 @@ class KoReaderSyncController:
         if payload is None:
             return
 
-        document = payload.get('document')
-        percentage_str = payload.get('percentage')
-        progress = payload.get('progress')
-        device = payload.get('device')
-        device_id = payload.get('device_id')
+        # A list of progress objects is stored in a single transaction.
+        records = payload if isinstance(payload, list) else [payload]
+        if not records:
+            self._send_json_error(self.ERROR_INVALID_FIELDS, 'Invalid payload: no records')
+            return
+
+        now = time.time()
+
+        rows = []
+        for record in records:
+            fields = self._validate_sync_record(record, now)
+            if fields is None:
+                return
+            rows.append((user, *fields))
 
-        if not self._is_valid_key_field(document) or not self._is_valid_field(progress) or not self._is_valid_field(device):
+        if len(rows) == 1:
+            self.sync_storage.upsert_record(*rows[0])
+        else:
+            self.sync_storage.upsert_many(rows)
+
+        if isinstance(payload, list):
+            self._send_json_response([
+                {'document': row[1], 'timestamp': row[6]} for row in rows
+            ])
+        else:
+            self._send_json_response({
+                'document': rows[0][1],
+                'timestamp': rows[0][6],
+            })
+
+    def _validate_sync_record(self, record, now):
+        """Validate one progress object.
+
+        Returns (document, percentage, progress, device, device_id, timestamp),
+        or None after sending the error response. A numeric client timestamp
+        is kept (clamped to [0, now + 1h]); otherwise, including NaN and
+        infinities, `now` is used.
+        """
+        if not isinstance(record, dict):
             self._send_json_error(self.ERROR_INVALID_FIELDS, 'Invalid payload: document, progress, and device required')
-            return
+            return None
+
+        document = record.get('document')
+        percentage_str = record.get('percentage')
+        progress = record.get('progress')
+        device = record.get('device')
+        device_id = record.get('device_id')
+
+        if not _is_valid_key_field(document) or not _is_valid_field(progress) or not _is_valid_field(device):
+            self._send_json_error(self.ERROR_INVALID_FIELDS, 'Invalid payload: document, progress, and device required')
+            return None
 
         try:
             percentage = float(percentage_str)
         except (TypeError, ValueError):
+            percentage = math.nan
+        if not math.isfinite(percentage):
             self._send_json_error(self.ERROR_INVALID_FIELDS, 'Invalid percentage')
-            return
-
-        timestamp = time.time()
+            return None
 
-        self.sync_storage.upsert_record(user, document, percentage, progress, device, device_id, timestamp)
+        # json.loads() accepts NaN and Infinity, which are not valid JSON to send back
+        timestamp = record.get('timestamp')
+        if type(timestamp) in (int, float) and math.isfinite(timestamp):
+            timestamp = min(max(timestamp, 0), now + MAX_CLIENT_CLOCK_SKEW)
+        else:
+            timestamp = now
 
-        self._send_json_response({
-            'document': document,
-            'timestamp': timestamp,
-        })
+        return document, percentage, progress, device, device_id, timestamp
 
     def _authorize(self):
         """Authorize user using X-Auth-User and X-Auth-Key headers."""
-        user = self.request.headers.get('X-Auth-User')
-        password_md5 = self.request.headers.get('X-Auth-Key')
-        if self._is_valid_key_field(user) and self._is_valid_field(password_md5):
+        get_header = self.request.headers.get
+        user = get_header('X-Auth-User')
+        password_md5 = get_header('X-Auth-Key')
+        if _is_valid_key_field(user) and _is_valid_field(password_md5):
             if self.sync_storage.verify_user(user, password_md5):
                 return user
         return None
@@ -248,17 +374,26 @@ class KoReaderSyncController:
             self._send_json_error(self.ERROR_INVALID_FIELDS, 'Empty request body')
             return None
 
-        body = self.request.rfile.read(length)
+        if length > MAX_JSON_BODY_SIZE:
+            self._send_json_error(self.ERROR_INVALID_FIELDS, 'Request body too large')
+            return None
+
+        body = bytearray(length)
+        if self.request.rfile.readinto(body) != length:
+            self._send_json_error(self.ERROR_INVALID_FIELDS, 'Incomplete request body')
+            return None
 
         try:
-            return json.loads(body.decode('utf-8'))
-        except json.JSONDecodeError:
+            # json.loads decodes UTF-8 bytes itself; ValueError also covers
+            # bodies that are not valid UTF-8.
+            return json.loads(body)
+        except ValueError:
             self._send_json_error(self.ERROR_INVALID_FIELDS, 'Invalid JSON payload')
             return None
 
     def _send_json_response(self, data, status=200):
         """Send JSON response."""
-        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        payload = _json_encode(data).encode('utf-8')
         self.request.send_response(status)
         self.request.send_header('Content-Type', 'application/json')
         self.request.send_header('Content-Length', str(len(payload)))
@@ -288,14 +423,14 @@ class KoReaderSyncController:
     def _extract_basic_auth(self, parsed_url=None):
         """Extract username and password from Authorization: Basic header."""
         auth_header = self.request.headers.get('Authorization')
-        if auth_header and auth_header.lower().startswith('basic '):
+        if auth_header and auth_header[:6].lower() == 'basic ':
             try:
-                b64 = auth_header.split(' ', 1)[1].strip()
-                decoded = base64.b64decode(b64).decode('utf-8')
-                username, password_md5 = decoded.split(':', 1)
-                return username, password_md5
+                decoded = _b64decode(auth_header[6:].strip()).decode('utf-8')
+                username, sep, password_md5 = decoded.partition(':')
+                if sep:
+                    return username, password_md5
             except Exception:
-                return None, None
+                pass
         return None, None
 
 
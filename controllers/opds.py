@@ -1,37 +1,137 @@
 """OPDS catalog HTTP handler and helpers."""
-import datetime
+import contextlib
+import functools
 import hashlib
 import heapq
+import itertools
+import operator
 import os
+import re
+import shutil
+import sqlite3
+import struct
+import threading
 import time
 import xml.etree.ElementTree as ET
 from xml.sax.saxutils import escape as xml_escape
 import zipfile
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import parse_qs, quote, unquote, urlparse
 
+from controllers.cache import TTLCache
+
 LIBRARY_DIR = os.environ.get('LIBRARY_DIR', 'books')
 PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 25))
+# Resolved once: the library root does not move while the server runs
+_LIBRARY_REALPATH = os.path.realpath(LIBRARY_DIR)
+_LIBRARY_REALPATH_PREFIX = _LIBRARY_REALPATH + os.sep
+# Request paths are appended to this instead of going through os.path.join(), which
+# would also silently discard LIBRARY_DIR for an absolute path
+_LIBRARY_DIR_PREFIX = LIBRARY_DIR.rstrip(os.sep) + os.sep
+METADATA_CACHE_DB_PATH = os.environ.get('METADATA_CACHE_DB_PATH', 'metadata_cache.db')
+METADATA_MEMORY_CACHE_SIZE = 4096
+COVER_MEMORY_CACHE_SIZE = 1024
+MEMORY_CACHE_TTL = 15 * 60
+
+# Shared pool for metadata extraction: zip reads and zlib release the GIL,
+# so cold pages are bound by the slowest book rather than the sum of all.
+_METADATA_EXECUTOR = ThreadPoolExecutor(
+    max_workers=min(32, (os.cpu_count() or 1) * 4),
+    thread_name_prefix='opds-metadata',
+)
+# Separate pool for directory walks so a full library scan never starves
+# page rendering; overlapping scandir calls hide per-directory latency.
+_SCAN_EXECUTOR = ThreadPoolExecutor(
+    max_workers=min(32, (os.cpu_count() or 1) * 4),
+    thread_name_prefix='opds-scan',
+)
+# Seconds between library polls that detect added/removed books (0 disables)
+LIBRARY_POLL_INTERVAL = int(os.environ.get('LIBRARY_POLL_INTERVAL', 60))
+# Directory levels listed serially before subtrees are handed to the pool.
+SCAN_SERIAL_DEPTH = 2
+
+_DC_TITLE = '{http://purl.org/dc/elements/1.1/}title'
+_DC_CREATOR = '{http://purl.org/dc/elements/1.1/}creator'
+_DC_DATE = '{http://purl.org/dc/elements/1.1/}date'
+_OPF_METADATA = '{http://www.idpf.org/2007/opf}metadata'
+_OPF_ITEM = '{http://www.idpf.org/2007/opf}item'
+
+# Element paths are plain strings so ElementTree's own path cache compiles
+# each of them once; the namespace maps are shared instead of rebuilt per call.
+_NS_CONTAINER = {'ocf': 'urn:oasis:names:tc:opendocument:xmlns:container'}
+_NS_OPF = {'opf': 'http://www.idpf.org/2007/opf'}
+_ROOTFILE_PATH = ".//ocf:rootfile[@media-type='application/oebps-package+xml']"
+_META_COVER_PATH = ".//opf:meta[@name='cover']"
+_ITEM_COVER_IMAGE_PATH = ".//opf:item[@properties='cover-image']"
+
+# A path component (split on / or \) that starts with a dot: hidden files and '.'/'..'
+_HIDDEN_COMPONENT_RE = re.compile(r'(?:^|[\\/])\.')
+
+# Sort key for (mtime, path) pairs: ties on mtime never fall back to comparing paths
+_by_mtime = operator.itemgetter(0)
+
+_FEED_CONTENT_TYPES = {
+    kind: f'application/xml;profile=opds-catalog;kind={kind}'
+    for kind in ('acquisition', 'navigation')
+}
+
+XSLT_PROCESSING_INSTRUCTION = b'<?xml-stylesheet type="text/xsl" href="/opds_to_html.xslt"?>\n'
+
+
+@functools.lru_cache(maxsize=METADATA_MEMORY_CACHE_SIZE)
+def opaque_id(value: str) -> str:
+    """Return a stable 128-bit hex fingerprint of value for use in atom ids.
+
+    blake2b is faster than md5 and there is no security requirement here.
+    Folder, author and feed ids repeat across requests, so results are
+    memoized like book_link_fields().
+    """
+    return hashlib.blake2b(value.encode(), digest_size=16).hexdigest()
+
+
+@functools.lru_cache(maxsize=METADATA_MEMORY_CACHE_SIZE)
+def book_link_fields(relative_path: str) -> tuple[str, str]:
+    """Return the (atom id, URL-encoded path) pair for a book relative to LIBRARY_DIR.
+
+    Both are pure functions of the path, so they are memoized instead of
+    being hashed and percent-encoded again on every catalog request.
+    """
+    book_id = f'urn:book:{opaque_id(relative_path)}'
+    encoded_path = quote(relative_path.replace(os.sep, '/'))
+    return book_id, encoded_path
 
 
 class BookMetadata:
+    @staticmethod
+    def _find_opf_path(zf: zipfile.ZipFile) -> str | None:
+        """Internal: return the OPF path inside the archive.
+
+        Nearly every EPUB ships exactly one .opf file; it is then taken from
+        the (already loaded) central directory and container.xml is only
+        parsed when the archive is ambiguous.
+        """
+        opf_names = [name for name in zf.namelist() if name.endswith('.opf')]
+        if len(opf_names) == 1:
+            return opf_names[0]
+
+        with zf.open('META-INF/container.xml') as container_file:
+            container_root = ET.parse(container_file).getroot()
+        rootfile = container_root.find(_ROOTFILE_PATH, _NS_CONTAINER)
+        if rootfile is None:
+            return None
+        return rootfile.get('full-path') or None
+
     @staticmethod
     def _parse_opf_from_epub(zf: zipfile.ZipFile) -> tuple[ET.Element | None, str | None]:
         """Internal: parse container.xml and OPF, return (opf_root, opf_dir)."""
         try:
-            container_xml = zf.read('META-INF/container.xml')
-            container_root = ET.fromstring(container_xml)
-            ns_container = {'ocf': 'urn:oasis:names:tc:opendocument:xmlns:container'}
-            rootfile = container_root.find(
-                ".//ocf:rootfile[@media-type='application/oebps-package+xml']",
-                ns_container,
-            )
-            if rootfile is None:
-                return None, None
-            opf_path = rootfile.get('full-path')
-            if not opf_path:
+            opf_path = BookMetadata._find_opf_path(zf)
+            if opf_path is None:
                 return None, None
-            opf_xml = zf.read(opf_path)
-            opf_root = ET.fromstring(opf_xml)
+            with zf.open(opf_path) as opf_file:
+                opf_root = ET.parse(opf_file).getroot()
             opf_dir = os.path.dirname(opf_path)
             return opf_root, opf_dir
         except Exception:
@@ -41,164 +141,537 @@ class BookMetadata:
     def extract_epub_metadata(epub_path: str) -> tuple[str | None, str | None, str | None]:
         """Extract metadata from EPUB file.
         
+        The OPF is streamed with iterparse and parsing stops as soon as the
+        three fields are found, or at the end of the <metadata> element at
+        the latest, so the manifest and spine are never built.
+
         Returns:
             tuple: (title, author, publication_date) or (None, None, None) if not found
         """
         try:
             with zipfile.ZipFile(epub_path) as zf:
-                opf_root, _ = BookMetadata._parse_opf_from_epub(zf)
-                if opf_root is None:
+                opf_path = BookMetadata._find_opf_path(zf)
+                if opf_path is None:
                     return None, None, None
 
-                ns_dc = {'dc': 'http://purl.org/dc/elements/1.1/'}
-                title_elem = opf_root.find(".//dc:title", ns_dc)
-                title = title_elem.text if title_elem is not None else None
-                author_elem = opf_root.find(".//dc:creator", ns_dc)
-                author = author_elem.text if author_elem is not None else None
-                date_elem = opf_root.find(".//dc:date", ns_dc)
-                publication_date = date_elem.text if date_elem is not None else None
+                title = author = publication_date = None
+                with zf.open(opf_path) as opf_file:
+                    for _, elem in ET.iterparse(opf_file, events=('end',)):
+                        tag = elem.tag
+                        if tag == _DC_TITLE:
+                            if title is None:
+                                title = elem.text
+                        elif tag == _DC_CREATOR:
+                            if author is None:
+                                author = elem.text
+                        elif tag == _DC_DATE:
+                            if publication_date is None:
+                                publication_date = elem.text
+                        elif tag == _OPF_METADATA:
+                            break
+                        if title is not None and author is not None and publication_date is not None:
+                            break
+                        elem.clear()
 
                 return title, author, publication_date
         except Exception:
             return None, None, None
 
     @staticmethod
-    def extract_epub_cover(epub_path: str) -> tuple[bytes | None, str | None]:
-        """Extract cover image from EPUB file.
-        
+    def _locate_cover(zf: zipfile.ZipFile) -> tuple[str | None, str | None]:
+        """Internal: return (cover_path inside the archive, mime_type) or (None, None)."""
+        opf_root, opf_dir = BookMetadata._parse_opf_from_epub(zf)
+        if opf_root is None:
+            return None, None
+
+        # Try to find cover using different methods
+        cover_id = None
+        cover_href = None
+        mime_type = None
+
+        # Method 1: Look for meta name="cover"
+        cover_meta = opf_root.find(_META_COVER_PATH, _NS_OPF)
+        if cover_meta is not None:
+            cover_id = cover_meta.get('content')
+
+        # Method 2: Look for item with properties="cover-image" (EPUB 3)
+        if not cover_id:
+            cover_item = opf_root.find(_ITEM_COVER_IMAGE_PATH, _NS_OPF)
+            if cover_item is not None:
+                cover_href = cover_item.get('href')
+                mime_type = cover_item.get('media-type')
+
+        # If we found a cover ID, get the href from manifest
+        if cover_id and not cover_href:
+            # Compare ids directly: interpolating cover_id into a path would
+            # defeat the path cache and break on ids containing quotes
+            cover_item = next(
+                (item for item in opf_root.iter(_OPF_ITEM) if item.get('id') == cover_id),
+                None,
+            )
+            if cover_item is not None:
+                cover_href = cover_item.get('href')
+                mime_type = cover_item.get('media-type', 'image/jpeg')
+
+        if not cover_href:
+            return None, None
+
+        # Resolve relative path
+        if opf_dir:
+            cover_path = os.path.join(opf_dir, cover_href).replace('\\', '/')
+        else:
+            cover_path = cover_href
+
+        # Raises KeyError if the manifest points at a missing entry
+        zf.getinfo(cover_path)
+
+        # Determine MIME type from file extension if not already set
+        if mime_type is None:
+            ext = os.path.splitext(cover_href)[1].lower()
+            mime_types = {
+                '.jpg': 'image/jpeg',
+                '.jpeg': 'image/jpeg',
+                '.png': 'image/png',
+                '.gif': 'image/gif',
+                '.webp': 'image/webp',
+            }
+            mime_type = mime_types.get(ext, 'image/jpeg')
+
+        return cover_path, mime_type
+
+    @staticmethod
+    def locate_epub_cover(epub_path: str) -> tuple[str | None, str | None, tuple | None]:
+        """Find the cover image of an EPUB file without reading it.
+
+        The entry's central directory record is returned too, so the cover
+        can later be streamed with iter_zip_entry() without parsing the
+        archive again. It is None for entries that need ZipFile to be read
+        (encrypted, or compressed with something other than deflate).
+
         Returns:
-            tuple: (cover_data, mime_type) or (None, None) if not found
+            tuple: (cover_path inside the archive, mime_type,
+                    (header_offset, compress_type, compress_size, file_size) or None)
+                   or (None, None, None) if not found
         """
         try:
             with zipfile.ZipFile(epub_path) as zf:
-                opf_root, opf_dir = BookMetadata._parse_opf_from_epub(zf)
-                if opf_root is None:
-                    return None, None
-
-                # Define namespaces
-                ns_opf = {'opf': 'http://www.idpf.org/2007/opf'}
-                
-                # Try to find cover using different methods
-                cover_id = None
-                cover_href = None
-                mime_type = None
-                
-                # Method 1: Look for meta name="cover"
-                cover_meta = opf_root.find(".//opf:meta[@name='cover']", ns_opf)
-                if cover_meta is not None:
-                    cover_id = cover_meta.get('content')
-                
-                # Method 2: Look for item with properties="cover-image" (EPUB 3)
-                if not cover_id:
-                    cover_item = opf_root.find(".//opf:item[@properties='cover-image']", ns_opf)
-                    if cover_item is not None:
-                        cover_href = cover_item.get('href')
-                        mime_type = cover_item.get('media-type')
-                
-                # If we found a cover ID, get the href from manifest
-                if cover_id and not cover_href:
-                    cover_item = opf_root.find(f".//opf:item[@id='{cover_id}']", ns_opf)
-                    if cover_item is not None:
-                        cover_href = cover_item.get('href')
-                        mime_type = cover_item.get('media-type', 'image/jpeg')
-                
-                # If we found a cover href, extract it
-                if cover_href:
-                    # Resolve relative path
-                    if opf_dir:
-                        cover_path = os.path.join(opf_dir, cover_href).replace('\\', '/')
-                    else:
-                        cover_path = cover_href
-                    
-                    # Read cover image
-                    cover_data = zf.read(cover_path)
-                    
-                    # Determine MIME type from file extension if not already set
-                    if mime_type is None:
-                        ext = os.path.splitext(cover_href)[1].lower()
-                        mime_types = {
-                            '.jpg': 'image/jpeg',
-                            '.jpeg': 'image/jpeg',
-                            '.png': 'image/png',
-                            '.gif': 'image/gif',
-                            '.webp': 'image/webp',
-                        }
-                        mime_type = mime_types.get(ext, 'image/jpeg')
-                    
-                    return cover_data, mime_type
-                
-                return None, None
+                cover_path, mime_type = BookMetadata._locate_cover(zf)
+                if cover_path is None:
+                    return None, None, None
+                info = zf.getinfo(cover_path)
+                entry = None
+                if not info.flag_bits & 0x1 and info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                    entry = (info.header_offset, info.compress_type, info.compress_size, info.file_size)
+                return cover_path, mime_type, entry
         except Exception:
-            return None, None
+            return None, None, None
+
+    @staticmethod
+    def iter_zip_entry(epub_path: str, entry: tuple, chunk_size: int = 64 * 1024):
+        """Return an iterator over the uncompressed bytes of one archive entry.
+
+        Seeks straight to the entry's local header using a cached central
+        directory record, so the archive's central directory is not read.
+        The header is checked before returning: OSError or BadZipFile are
+        raised here, not halfway through the iteration. The CRC is not
+        verified.
+        """
+        header_offset, compress_type, compress_size, _ = entry
+        f = open(epub_path, 'rb')
+        try:
+            f.seek(header_offset)
+            header = f.read(30)
+            if len(header) != 30 or header[:4] != b'PK\x03\x04':
+                raise zipfile.BadZipFile('Bad local file header')
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            f.seek(name_length + extra_length, os.SEEK_CUR)
+        except BaseException:
+            f.close()
+            raise
+        return BookMetadata._iter_entry_data(f, compress_type, compress_size, chunk_size)
+
+    @staticmethod
+    def _iter_entry_data(f, compress_type: int, compress_size: int, chunk_size: int):
+        with f:
+            decompressor = zlib.decompressobj(-15) if compress_type == zipfile.ZIP_DEFLATED else None
+            remaining = compress_size
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise zipfile.BadZipFile('Truncated archive entry')
+                remaining -= len(chunk)
+                yield decompressor.decompress(chunk) if decompressor else chunk
+            if decompressor:
+                yield decompressor.flush()
+
+
+class MetadataCache:
+    """Persistent SQLite cache of EPUB metadata keyed by (path, mtime, size).
+
+    Exposes the same extract_epub_metadata() as BookMetadata, so it can be
+    used as a drop-in extractor: a hit costs one stat and one indexed
+    lookup instead of opening the zip and parsing container.xml and the OPF.
+    Cover locations (entry name, MIME type and central directory record) are
+    cached the same way, so serving a cover only seeks to the entry. Hot
+    entries are also kept in bounded in-memory LRUs so repeated feeds do not
+    even reach SQLite. If the database cannot be opened only the in-memory
+    layer is used.
+    """
+
+    SCHEMA_VERSION = 3
+
+    _SQL_UPSERT_BOOK = """
+        INSERT INTO books (path, mtime_ns, size, title, author, pub_date)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(path) DO UPDATE SET
+            mtime_ns = excluded.mtime_ns,
+            size = excluded.size,
+            title = excluded.title,
+            author = excluded.author,
+            pub_date = excluded.pub_date
+    """
+
+    _instance = None  # Singleton instance
+
+    @classmethod
+    def get_instance(cls) -> 'MetadataCache':
+        """Get or create singleton instance."""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, db_path: str = METADATA_CACHE_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._memory = TTLCache(METADATA_MEMORY_CACHE_SIZE, MEMORY_CACHE_TTL)
+        self._cover_locations = TTLCache(COVER_MEMORY_CACHE_SIZE, MEMORY_CACHE_TTL)
+        self._batch_depth = 0
+        self._pending_books = []  # rows waiting for the end of batch_writes()
+        try:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._ensure_tables()
+        except sqlite3.Error as exc:
+            print(f"Metadata cache disabled ({db_path}): {exc}")
+            self._conn = None
+
+    def _ensure_tables(self) -> None:
+        """Create the cache table, rebuilding it when the schema version changes."""
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != self.SCHEMA_VERSION:
+            self._conn.execute('DROP TABLE IF EXISTS books')
+            self._conn.execute('DROP TABLE IF EXISTS covers')
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS books (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                title TEXT,
+                author TEXT,
+                pub_date TEXT
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS covers (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                cover_path TEXT,
+                mime_type TEXT,
+                header_offset INTEGER,
+                compress_type INTEGER,
+                compress_size INTEGER,
+                file_size INTEGER
+            )
+            """
+        )
+        self._conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+
+    def extract_epub_metadata(self, epub_path: str, st: os.stat_result | None = None) -> tuple[str | None, str | None, str | None]:
+        """Return (title, author, publication_date), from the cache when fresh.
+
+        Callers that already stat()ed the file can pass the result to avoid a
+        second syscall.
+        """
+        if st is None:
+            try:
+                st = os.stat(epub_path)
+            except OSError:
+                return None, None, None
+
+        key = os.path.abspath(epub_path)
+        memory_key = (key, st.st_mtime_ns, st.st_size)
+        metadata = self._memory.get(memory_key)
+        if metadata is not None:
+            return metadata
+        if self._conn is None:
+            metadata = BookMetadata.extract_epub_metadata(epub_path)
+            self._memory.set(memory_key, metadata)
+            return metadata
+
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    'SELECT mtime_ns, size, title, author, pub_date FROM books WHERE path = ?',
+                    (key,),
+                ).fetchone()
+        except sqlite3.Error:
+            row = None
+        if row is not None and row[0] == st.st_mtime_ns and row[1] == st.st_size:
+            metadata = (row[2], row[3], row[4])
+            self._memory.set(memory_key, metadata)
+            return metadata
+
+        metadata = BookMetadata.extract_epub_metadata(epub_path)
+        row = (key, st.st_mtime_ns, st.st_size, *metadata)
+        with self._lock:
+            if self._batch_depth:
+                self._pending_books.append(row)
+                row = None
+        if row is not None:
+            try:
+                with self._lock:
+                    self._conn.execute(self._SQL_UPSERT_BOOK, row)
+            except sqlite3.Error:
+                pass
+        self._memory.set(memory_key, metadata)
+        return metadata
+
+    @contextlib.contextmanager
+    def batch_writes(self):
+        """Defer metadata inserts made inside the block to a single executemany transaction.
+
+        Used while (re)building the library index so a cold scan commits once
+        instead of once per book. Lookups inside the block still hit the
+        in-memory layer for entries computed so far.
+        """
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if not self._batch_depth and self._pending_books:
+                    self._flush_pending_books()
+
+    def _flush_pending_books(self) -> None:
+        """Write buffered rows in one transaction. Caller holds self._lock."""
+        rows, self._pending_books = self._pending_books, []
+        conn = self._conn
+        try:
+            conn.execute('BEGIN')
+            try:
+                conn.executemany(self._SQL_UPSERT_BOOK, rows)
+                conn.execute('COMMIT')
+            except BaseException:
+                # Also after a failed COMMIT: a transaction left open would
+                # silently swallow every later autocommit upsert.
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as exc:
+            print(f"Metadata cache batch write failed: {exc}")
+
+    def locate_epub_cover(self, epub_path: str, st: os.stat_result | None = None) -> tuple[str | None, str | None, tuple | None]:
+        """Return BookMetadata.locate_epub_cover()'s result, from the cache when fresh."""
+        if st is None:
+            try:
+                st = os.stat(epub_path)
+            except OSError:
+                return None, None, None
+
+        key = os.path.abspath(epub_path)
+        memory_key = (key, st.st_mtime_ns, st.st_size)
+        location = self._cover_locations.get(memory_key)
+        if location is not None:
+            return location
+        if self._conn is None:
+            location = BookMetadata.locate_epub_cover(epub_path)
+            self._cover_locations.set(memory_key, location)
+            return location
+
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    'SELECT mtime_ns, size, cover_path, mime_type, header_offset, compress_type, '
+                    'compress_size, file_size FROM covers WHERE path = ?',
+                    (key,),
+                ).fetchone()
+        except sqlite3.Error:
+            row = None
+        if row is not None and row[0] == st.st_mtime_ns and row[1] == st.st_size:
+            entry = None if row[4] is None else tuple(row[4:8])
+            location = (row[2], row[3], entry)
+            self._cover_locations.set(memory_key, location)
+            return location
+
+        location = BookMetadata.locate_epub_cover(epub_path)
+        try:
+            with self._lock:
+                self._conn.execute(
+                    """
+                    INSERT INTO covers (
+                        path, mtime_ns, size, cover_path, mime_type,
+                        header_offset, compress_type, compress_size, file_size
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(path) DO UPDATE SET
+                        mtime_ns = excluded.mtime_ns,
+                        size = excluded.size,
+                        cover_path = excluded.cover_path,
+                        mime_type = excluded.mime_type,
+                        header_offset = excluded.header_offset,
+                        compress_type = excluded.compress_type,
+                        compress_size = excluded.compress_size,
+                        file_size = excluded.file_size
+                    """,
+                    (key, st.st_mtime_ns, st.st_size, location[0], location[1], *(location[2] or (None,) * 4)),
+                )
+        except sqlite3.Error:
+            pass
+        self._cover_locations.set(memory_key, location)
+        return location
 
 
 class SecurityUtils:
     @staticmethod
     def is_within_library_dir(file_path: str) -> bool:
-        library_realpath = os.path.realpath(LIBRARY_DIR)
         file_realpath = os.path.realpath(file_path)
-        return file_realpath.startswith(library_realpath + os.sep) or file_realpath == library_realpath
+        return file_realpath.startswith(_LIBRARY_REALPATH_PREFIX) or file_realpath == _LIBRARY_REALPATH
 
     @staticmethod
     def has_path_traversal(path: str) -> bool:
         """Check if path contains dangerous traversal sequences."""
-        dangerous_patterns = ['..', '~']
+        # Substring checks run in C and settle the common safe case; only
+        # then scan for a hidden component with the precompiled regex.
+        return '..' in path or '~' in path or _HIDDEN_COMPONENT_RE.search(path) is not None
 
-        for pattern in dangerous_patterns:
-            if pattern in path:
-                return True
 
-        path_components = path.replace('\\', '/').split('/')
-        for component in path_components:
-            if component in dangerous_patterns or component.startswith('.'):
-                return True
+_XML_ATTR_ENTITIES = {'"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#09;'}
 
-        return False
 
+def _xml_text(value) -> str:
+    return '' if value is None else xml_escape(str(value))
 
-class OPDSFeedGenerator:
-    @staticmethod
-    def generate_feed(title: str, feed_id: str, links: list[tuple[str, str, str]], entries: list[dict]) -> str:
-        feed = ET.Element(
-            'feed',
-            {
-                'xmlns': 'http://www.w3.org/2005/Atom',
-                'xmlns:opds': 'http://opds-spec.org/2010/catalog',
-            },
-        )
 
-        ET.SubElement(feed, 'title').text = title
-        ET.SubElement(feed, 'id').text = feed_id
-        ET.SubElement(feed, 'updated').text = (
-            datetime.datetime.now(datetime.timezone.utc).isoformat() + 'Z'
-        )
+def _xml_link(rel: str, href: str, type_: str) -> str:
+    return (
+        f'<link rel="{xml_escape(rel, _XML_ATTR_ENTITIES)}" href="{xml_escape(href, _XML_ATTR_ENTITIES)}" '
+        f'type="{xml_escape(type_, _XML_ATTR_ENTITIES)}" />'
+    )
 
-        for rel, href, type_ in links:
-            ET.SubElement(feed, 'link', {'rel': rel, 'href': href, 'type': type_})
 
-        for entry_data in entries:
-            entry = ET.SubElement(feed, 'entry')
-            ET.SubElement(entry, 'title').text = entry_data['title']
-            ET.SubElement(entry, 'id').text = entry_data['id']
+class OPDSFeedGenerator:
+    @staticmethod
+    def generate_feed(title: str, feed_id: str, links: list[tuple[str, str, str]], entries: list[dict]) -> bytes:
+        """Build an Atom/OPDS feed and return it as UTF-8 encoded bytes."""
+        # Fixed schema, so the document is emitted directly as escaped text
+        # instead of building and then serializing an Element tree.
+        parts = [
+            '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opds="http://opds-spec.org/2010/catalog">',
+            f'<title>{_xml_text(title)}</title>',
+            f'<id>{_xml_text(feed_id)}</id>',
+            f'<updated>{time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}</updated>',
+        ]
+        parts.extend(_xml_link(rel, href, type_) for rel, href, type_ in links)
 
+        for entry_data in entries:
+            parts.append(f'<entry><title>{_xml_text(entry_data["title"])}</title><id>{_xml_text(entry_data["id"])}</id>')
             if 'author' in entry_data:
-                author = ET.SubElement(entry, 'author')
-                ET.SubElement(author, 'name').text = entry_data['author']
+                parts.append(f'<author><name>{_xml_text(entry_data["author"])}</name></author>')
+            parts.extend(_xml_link(rel, href, type_) for rel, href, type_ in entry_data['links'])
+            parts.append('</entry>')
+
+        parts.append('</feed>')
+        return XSLT_PROCESSING_INSTRUCTION + ''.join(parts).encode('utf-8')
+
+
+class LibraryIndex:
+    """In-memory, column-oriented snapshot of every book in the library.
+
+    One parallel list per field, in catalog order (file name, case
+    insensitive), so paginated feeds are a slice and year/author/search
+    lookups scan plain strings without touching the disk. Year and author
+    groups hold positions into those lists.
+    """
+
+    def __init__(self, signature: frozenset, paths: list[str], relative_paths: list[str],
+                 metadata: list[tuple], mtimes: list[float]):
+        # (path, mtime_ns, size) of every book seen by the walk, used to detect
+        # added, removed and modified books
+        self.signature = signature
+        self.paths = paths
+        self.relative_paths = relative_paths
+        self.titles = []
+        self.authors = []
+        self.publication_dates = []
+        self.years = []
+        for path, (title, author, pub_date) in zip(paths, metadata):
+            self.titles.append(title or os.path.basename(path))
+            self.authors.append(author or 'Unknown')
+            self.publication_dates.append(pub_date)
+            self.years.append(BookScanner._extract_year(pub_date))
+        self.mtimes = array('d', mtimes)
+        # Lowercased once here so searches do not call .lower() per book per query
+        self.search_titles = [title.lower() for title in self.titles]
+        self.search_authors = [author.lower() for author in self.authors]
+
+        self.year_positions = {}  # {year: [positions...]}
+        self.author_positions = {}  # {author: [positions...]}
+        for position, (year, author) in enumerate(zip(self.years, self.authors)):
+            self.year_positions.setdefault(year, []).append(position)
+            self.author_positions.setdefault(author, []).append(position)
+
+        # Navigation lists are sorted once per build rather than on every request:
+        # known years descending and authors alphabetically, 'Unknown' last in both.
+        self.year_counts = sorted(
+            ((year, len(positions)) for year, positions in self.year_positions.items()),
+            key=lambda x: (x[0] == 'Unknown', -int(x[0]) if x[0] != 'Unknown' else 0)
+        )
+        self.author_counts = sorted(
+            ((author, len(positions)) for author, positions in self.author_positions.items()),
+            key=lambda x: (x[0] == 'Unknown', x[0].lower())
+        )
+        # Authors bucketed by upper-cased first letter, in author_counts order;
+        # 'Unknown', empty names and non-letters go under '#'
+        self.authors_by_letter = {}
+        for author, count in self.author_counts:
+            first = author[:1].upper()
+            letter = first if author != 'Unknown' and first.isalpha() else '#'
+            self.authors_by_letter.setdefault(letter, []).append((author, count))
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def book(self, position: int) -> dict:
+        """Return the book info dict at a catalog position."""
+        return {
+            'path': self.paths[position],
+            'relative_path': self.relative_paths[position],
+            'title': self.titles[position],
+            'author': self.authors[position],
+            'publication_date': self.publication_dates[position],
+            'year': self.years[position],
+            'mtime': self.mtimes[position],
+        }
 
-            for rel, href, type_ in entry_data['links']:
-                ET.SubElement(entry, 'link', {'rel': rel, 'href': href, 'type': type_})
+    def books(self, positions) -> list[dict]:
+        return [self.book(position) for position in positions]
 
-        xml_string = ET.tostring(feed, encoding='unicode', method='xml')
-        processing_instruction = (
-            '<?xml-stylesheet type="text/xsl" href="/opds_to_html.xslt"?>\n'
-        )
-        return processing_instruction + xml_string
+    def slice(self, start: int, end: int) -> list[dict]:
+        return self.books(range(max(start, 0), min(end, len(self.paths))))
 
 
 class BookScanner:
     """Scanner for EPUB files with caching."""
     
     _instance = None  # Singleton instance
+    AUTHOR_LETTERS = tuple(chr(i) for i in range(ord('A'), ord('Z') + 1)) + ('#',)
     
     @classmethod
     def get_instance(cls) -> 'BookScanner':
@@ -208,25 +681,27 @@ class BookScanner:
         return cls._instance
     
     def __init__(self):
-        self.metadata_extractor = BookMetadata()
+        self.metadata_extractor = MetadataCache.get_instance()
         self.security = SecurityUtils()
-        self._all_paths_cache = None
-        self._all_books_metadata_cache = None
-        # Lightweight index caches: only store path -> year/author mapping
-        self._year_index = None  # {year: [paths...]}
-        self._author_index = None  # {author: [paths...]}
-        self._recent_books_cache = None
-        self._recent_books_cache_time = 0
+        self._library_index = None
+        # Serializes index builds between request threads and the watcher
+        self._index_lock = threading.Lock()
+        self._watcher = None
         self.RECENT_CACHE_TTL = 300
+        self._recent_books_cache = TTLCache(maxsize=8, ttl=self.RECENT_CACHE_TTL)
+        # Serialized feeds as (body, etag), keyed by (cache_generation, request path)
+        self.feed_cache = TTLCache(maxsize=256, ttl=self.RECENT_CACHE_TTL)
+        # Bumped whenever the caches above are cleared. Derived caches include it
+        # in their keys, so a result computed from the previous index and stored
+        # after the clear lands under a key that is never read again.
+        self.cache_generation = 0
     
     def invalidate_caches(self) -> None:
         """Invalidate all caches. Called when a missing file is detected."""
-        self._all_paths_cache = None
-        self._all_books_metadata_cache = None
-        self._year_index = None
-        self._author_index = None
-        self._recent_books_cache = None
-        self._recent_books_cache_time = 0
+        self._library_index = None
+        self.cache_generation += 1
+        self._recent_books_cache.clear()
+        self.feed_cache.clear()
     
     def _create_book_info_from_path(self, path: str) -> dict:
         """Create book info dict from file path. Used to avoid code duplication."""
@@ -244,13 +719,112 @@ class BookScanner:
             'mtime': self._safe_getmtime(path),
         }
 
-    def collect_all_epub_paths(self) -> list[str]:
-        paths = []
-        for root, _, files in os.walk(LIBRARY_DIR):
-            for file in files:
-                if file.endswith('.epub'):
-                    paths.append(os.path.join(root, file))
-        return sorted(paths, key=lambda p: os.path.basename(p).lower())
+    @staticmethod
+    def _is_library_epub(entry: os.DirEntry) -> bool:
+        """True for regular files, and for symlinked files that resolve inside LIBRARY_DIR."""
+        if not entry.is_file():
+            return False
+        return not entry.is_symlink() or SecurityUtils.is_within_library_dir(entry.path)
+
+    @staticmethod
+    def _should_descend(entry: os.DirEntry, skip_hidden_dirs: bool, seen_links: set | None) -> bool:
+        """True if the walk should enter entry.
+
+        Symlinked directories are only followed when seen_links is a set
+        (i.e. the caller asked for it), when they resolve inside LIBRARY_DIR
+        and when their target has not been entered yet, so link cycles end.
+        """
+        if skip_hidden_dirs and entry.name.startswith('.'):
+            return False
+        if entry.is_dir(follow_symlinks=False):
+            return True
+        if seen_links is None or not entry.is_symlink() or not entry.is_dir():
+            return False
+        target = os.path.realpath(entry.path)
+        if target in seen_links or not SecurityUtils.is_within_library_dir(target):
+            return False
+        seen_links.add(target)
+        return True
+
+    @staticmethod
+    def _scan_epub_tree(root: str, skip_hidden_dirs: bool = False, follow_dir_links: bool = False) -> list[os.DirEntry]:
+        """Iterative scandir walk returning the .epub file entries under root.
+
+        DirEntry type checks come from the directory listing itself, so
+        files are never stat()ed. Symlinked directories are only followed
+        with follow_dir_links, and then only when they resolve inside the
+        library; symlinked files must resolve inside the library too, so
+        every returned path is known to be within LIBRARY_DIR.
+        """
+        found = []
+        pending = [root]
+        seen_links = {os.path.realpath(root)} if follow_dir_links else None
+        while pending:
+            try:
+                with os.scandir(pending.pop()) as entries:
+                    for entry in entries:
+                        if entry.name.endswith('.epub'):
+                            if BookScanner._is_library_epub(entry):
+                                found.append(entry)
+                        elif BookScanner._should_descend(entry, skip_hidden_dirs, seen_links):
+                            pending.append(entry.path)
+            except OSError:
+                continue
+        return found
+
+    @classmethod
+    def _scan_epub_tree_parallel(
+        cls, root: str, worker, skip_hidden_dirs: bool = False, follow_dir_links: bool = False
+    ) -> tuple[list[os.DirEntry], list]:
+        """Walk the first SCAN_SERIAL_DEPTH levels, then run worker on each deeper subtree in the pool.
+
+        Returns the .epub entries found in the serial levels and the list of
+        worker results, one per subtree, so callers can merge them without
+        sharing state between threads.
+        """
+        found = []
+        level = [root]
+        seen_links = {os.path.realpath(root)} if follow_dir_links else None
+        for _ in range(SCAN_SERIAL_DEPTH):
+            next_level = []
+            for path in level:
+                try:
+                    with os.scandir(path) as entries:
+                        for entry in entries:
+                            if entry.name.endswith('.epub'):
+                                if cls._is_library_epub(entry):
+                                    found.append(entry)
+                            elif cls._should_descend(entry, skip_hidden_dirs, seen_links):
+                                next_level.append(entry.path)
+                except OSError:
+                    continue
+            level = next_level
+        return found, list(_SCAN_EXECUTOR.map(worker, level))
+
+    def _collect_epub_entries(self) -> list[os.DirEntry]:
+        top_entries, subtree_entries = self._scan_epub_tree_parallel(LIBRARY_DIR, self._scan_epub_tree)
+        # DirEntry.name is already the basename, so no os.path.basename() per key
+        return sorted(itertools.chain(top_entries, *subtree_entries), key=lambda entry: entry.name.lower())
+
+    @staticmethod
+    def _stat_entries(entries: list[os.DirEntry]) -> list[tuple[str, os.stat_result]]:
+        """Stat each scanned book once; books that vanished since the listing are dropped."""
+        stats = []
+        for entry in entries:
+            try:
+                stats.append((entry.path, entry.stat()))
+            except OSError:
+                continue
+        return stats
+
+    @staticmethod
+    def _library_signature(stats: list[tuple[str, os.stat_result]]) -> frozenset:
+        """Return the (path, mtime_ns, size) set of the scanned books.
+
+        Books replaced or edited in place keep their path, so the stat
+        fields are needed to notice them.
+        """
+        return frozenset((path, st.st_mtime_ns, st.st_size) for path, st in stats)
 
     def scan_directory_single_level(self, directory_path: str, base_path: str | None = None) -> list[dict]:
         if base_path is None:
@@ -259,11 +833,10 @@ class BookScanner:
         file_list = []
 
         try:
-            for file in os.listdir(directory_path):
-                if file.endswith('.epub'):
-                    file_path = os.path.join(directory_path, file)
-                    if os.path.isfile(file_path):
-                        file_info = self._create_file_info(directory_path, file, base_path)
+            with os.scandir(directory_path) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.epub') and self._is_library_epub(entry):
+                        file_info = self._create_file_info(directory_path, entry.name, base_path)
                         if file_info:
                             file_list.append(file_info)
         except OSError:
@@ -271,50 +844,113 @@ class BookScanner:
 
         return sorted(file_list, key=lambda x: x['title'].lower())
 
-    def get_all_books_paginated(self, page: int, size: int) -> tuple[list[dict], int]:
-        if self._all_paths_cache is None:
-            self._all_paths_cache = self.collect_all_epub_paths()
-
-        paths = self._all_paths_cache
-        total_count = len(paths)
+    def get_library_index(self) -> LibraryIndex:
+        """Return the in-memory library index, building it on first use.
 
-        start = (page - 1) * size
-        end = start + size
-        paginated_paths = paths[start:end]
+        Builds are serialized, so a request arriving while the watcher (or
+        another request) is scanning waits for that index instead of
+        starting a second scan.
+        """
+        index = self._library_index
+        if index is None:
+            with self._index_lock:
+                index = self._library_index
+                if index is None:
+                    index = self._build_library_index()
+                    self._library_index = index
+        return index
+
+    def refresh_library_index(self) -> bool:
+        """Rebuild the index if books were added, removed or modified.
+
+        The current index keeps serving requests during the rebuild; the new
+        one is swapped in before the derived caches are cleared. Returns True
+        when the index was replaced.
+        """
+        with self._index_lock:
+            stats = self._stat_entries(self._collect_epub_entries())
+            signature = self._library_signature(stats)
+            index = self._library_index
+            if index is not None and index.signature == signature:
+                return False
+            self._library_index = self._build_library_index(stats, signature)
+            self.cache_generation += 1
+            self._recent_books_cache.clear()
+            self.feed_cache.clear()
+        return True
 
-        paginated_books = []
-        for path in paginated_paths:
+    def _build_library_index(self, stats: list[tuple[str, os.stat_result]] | None = None,
+                             signature: frozenset | None = None) -> LibraryIndex:
+        if stats is None:
+            stats = self._stat_entries(self._collect_epub_entries())
+        if signature is None:
+            # Taken before reading metadata: a book changed during the build
+            # then differs from the signature and is picked up by the next poll.
+            signature = self._library_signature(stats)
+        # Scanned paths are already confined to LIBRARY_DIR (see _scan_epub_tree),
+        # so each one is validated here once and the index is trusted afterwards.
+        paths = []
+        relative_paths = []
+        path_stats = []
+        for path, st in stats:
             relative_path = os.path.relpath(path, LIBRARY_DIR)
-            if self.security.has_path_traversal(relative_path) or not self.security.is_within_library_dir(path):
-                continue
-            title, author, pub_date = self.metadata_extractor.extract_epub_metadata(path)
-            title = title or os.path.basename(path)
-            author = author or 'Unknown'
-            paginated_books.append(
-                {
-                    'path': path,
-                    'relative_path': relative_path,
-                    'title': title,
-                    'author': author,
-                    'publication_date': pub_date,
-                    'mtime': os.path.getmtime(path),
-                }
-            )
+            if not self.security.has_path_traversal(relative_path):
+                paths.append(path)
+                relative_paths.append(relative_path)
+                path_stats.append(st)
+        with self.metadata_extractor.batch_writes():
+            # The scan's stat is passed on, so metadata lookups do not stat again
+            metadata = list(_METADATA_EXECUTOR.map(self.metadata_extractor.extract_epub_metadata, paths, path_stats))
+        return LibraryIndex(
+            signature,
+            paths,
+            relative_paths,
+            metadata,
+            [st.st_mtime for st in path_stats],
+        )
+
+    def start_library_watcher(self, interval: float = LIBRARY_POLL_INTERVAL) -> None:
+        """Build the index in the background and keep it in sync by polling LIBRARY_DIR.
+
+        Polling lists directories and stats each book (no zip reads); when a
+        book is added, removed or modified the caches are invalidated and
+        the index rebuilt, so requests keep being served from memory.
+        """
+        if interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(
+            target=self._watch_library,
+            args=(interval,),
+            name='opds-library-watcher',
+            daemon=True,
+        )
+        self._watcher.start()
 
-        return paginated_books, total_count
+    def _watch_library(self, interval: float) -> None:
+        self.get_library_index()
+        while True:
+            time.sleep(interval)
+            try:
+                self.refresh_library_index()
+            except Exception as exc:
+                print(f"Library watcher error: {exc}")
+
+    def get_all_books_paginated(self, page: int, size: int) -> tuple[list[dict], int]:
+        index = self.get_library_index()
+        start = (page - 1) * size
+        return index.slice(start, start + size), len(index)
 
     def get_folder_content_paginated(self, folder_full_path: str, parent_folder_path: str, page: int, size: int, base_path: str | None = None) -> tuple[list[dict], int]:
-        subfolders = []
-        for item in os.listdir(folder_full_path):
-            item_path = os.path.join(folder_full_path, item)
-            if os.path.isdir(item_path) and not item.startswith('.'):
-                subfolders.append(item)
-        subfolders = sorted(subfolders)
+        with os.scandir(folder_full_path) as entries:
+            subfolders = sorted(
+                entry.name for entry in entries
+                if not entry.name.startswith('.') and entry.is_dir()
+            )
 
         subfolder_entries = []
         for subfolder in subfolders:
             subfolder_relative = os.path.join(parent_folder_path, subfolder)
-            subfolder_id = f'urn:folder:{hashlib.md5(subfolder_relative.encode()).hexdigest()}'
+            subfolder_id = f'urn:folder:{opaque_id(subfolder_relative)}'
             encoded_subfolder = quote(subfolder_relative.replace(os.sep, '/'))
 
             subfolder_entries.append(
@@ -336,8 +972,7 @@ class BookScanner:
 
         book_entries = []
         for file_info in book_list:
-            book_id = f'urn:book:{hashlib.md5(file_info["relative_path"].encode()).hexdigest()}'
-            encoded_path = quote(file_info['relative_path'].replace(os.sep, '/'))
+            book_id, encoded_path = book_link_fields(file_info['relative_path'])
 
             book_entries.append(
                 {
@@ -365,61 +1000,64 @@ class BookScanner:
         return paginated_entries, total_count
 
     def scan_recent_books(self, directory_path: str, limit: int = 25) -> list[dict]:
-        current_time = time.time()
-        if (
-            self._recent_books_cache is not None
-            and current_time - self._recent_books_cache_time < self.RECENT_CACHE_TTL
-        ):
-            return self._recent_books_cache[:limit]
-
-        heap = []
-
-        def scan_for_recent_files(path):
-            try:
-                for entry in os.scandir(path):
-                    if entry.is_file() and entry.name.endswith('.epub'):
-                        try:
-                            stat_info = entry.stat()
-                            mtime = stat_info.st_mtime
-                            if len(heap) < limit:
-                                heapq.heappush(heap, (mtime, entry.path))
-                            elif mtime > heap[0][0]:
-                                heapq.heapreplace(heap, (mtime, entry.path))
-                        except OSError:
-                            continue
-                    elif entry.is_dir() and not entry.name.startswith('.'):
-                        scan_for_recent_files(entry.path)
-            except OSError:
-                pass
+        cache_key = (self.cache_generation, directory_path)
+        cached = self._recent_books_cache.get(cache_key)
+        if cached is not None:
+            return cached[:limit]
+
+        def stat_mtimes(entries):
+            # One stat() per entry; nlargest() then only compares the mtimes.
+            for entry in entries:
+                try:
+                    yield entry.stat().st_mtime, entry.path
+                except OSError:
+                    continue
+
+        def most_recent(entries):
+            return heapq.nlargest(limit, stat_mtimes(entries), key=_by_mtime)
+
+        # Each subtree keeps its own top-`limit` list; they are merged here.
+        # nlargest() returns newest first, so no further sort is needed.
+        # Symlinked folders that stay inside the library are part of Recent.
+        top_entries, subtree_recent = self._scan_epub_tree_parallel(
+            directory_path,
+            lambda path: most_recent(self._scan_epub_tree(path, skip_hidden_dirs=True, follow_dir_links=True)),
+            skip_hidden_dirs=True,
+            follow_dir_links=True,
+        )
+        recent_files = heapq.nlargest(
+            limit, itertools.chain(most_recent(top_entries), *subtree_recent), key=_by_mtime
+        )
 
-        scan_for_recent_files(directory_path)
+        allowed_files = []
+        for mtime, file_path in recent_files:
+            relative_path = os.path.relpath(file_path, directory_path)
+            # Scanned paths are already confined to LIBRARY_DIR (see _scan_epub_tree)
+            if not self.security.has_path_traversal(relative_path):
+                allowed_files.append((mtime, file_path, relative_path))
 
-        recent_files = sorted(heap, key=lambda x: x[0], reverse=True)
+        metadata = _METADATA_EXECUTOR.map(
+            self.metadata_extractor.extract_epub_metadata,
+            [file_path for _, file_path, _ in allowed_files],
+        )
 
         file_list = []
-        for mtime, file_path in recent_files:
-            relative_path = os.path.relpath(file_path, directory_path)
-            if (
-                not self.security.has_path_traversal(relative_path)
-                and self.security.is_within_library_dir(file_path)
-            ):
-                title, author, pub_date = self.metadata_extractor.extract_epub_metadata(file_path)
-                title = title or os.path.basename(file_path)
-                author = author or 'Unknown'
-
-                file_list.append(
-                    {
-                        'path': file_path,
-                        'relative_path': relative_path,
-                        'title': title,
-                        'author': author,
-                        'publication_date': pub_date,
-                        'mtime': mtime,
-                    }
-                )
+        for (mtime, file_path, relative_path), (title, author, pub_date) in zip(allowed_files, metadata):
+            title = title or os.path.basename(file_path)
+            author = author or 'Unknown'
 
-        self._recent_books_cache = file_list
-        self._recent_books_cache_time = current_time
+            file_list.append(
+                {
+                    'path': file_path,
+                    'relative_path': relative_path,
+                    'title': title,
+                    'author': author,
+                    'publication_date': pub_date,
+                    'mtime': mtime,
+                }
+            )
+
+        self._recent_books_cache.set(cache_key, file_list)
 
         return file_list
 
@@ -427,7 +1065,8 @@ class BookScanner:
         path = os.path.join(root, filename)
         relative_path = os.path.relpath(path, base_path)
 
-        if self.security.has_path_traversal(relative_path) or not self.security.is_within_library_dir(path):
+        # Confinement was checked by _is_library_epub() when the entry was listed
+        if self.security.has_path_traversal(relative_path):
             return None
 
         title, author, pub_date = self.metadata_extractor.extract_epub_metadata(path)
@@ -473,108 +1112,18 @@ class BookScanner:
     def collect_all_books_with_metadata(self) -> list[dict]:
         """Collect all books with full metadata.
         
-        Uses cached metadata if available for better performance.
+        Served from the in-memory library index.
         Returns list of book info dicts with metadata.
         """
-        if self._all_books_metadata_cache is not None:
-            return self._all_books_metadata_cache
-        
-        if self._all_paths_cache is None:
-            self._all_paths_cache = self.collect_all_epub_paths()
-        
-        books = []
-        for path in self._all_paths_cache:
-            relative_path = os.path.relpath(path, LIBRARY_DIR)
-            if self.security.has_path_traversal(relative_path) or not self.security.is_within_library_dir(path):
-                continue
-            title, author, pub_date = self.metadata_extractor.extract_epub_metadata(path)
-            title = title or os.path.basename(path)
-            author = author or 'Unknown'
-            books.append({
-                'path': path,
-                'relative_path': relative_path,
-                'title': title,
-                'author': author,
-                'publication_date': pub_date,
-                'year': self._extract_year(pub_date),
-                'mtime': self._safe_getmtime(path),
-            })
-        
-        self._all_books_metadata_cache = books
-        return books
-
-    def _build_year_author_indexes(self) -> None:
-        """Build lightweight indexes for year and author lookups.
-        
-        Only extracts minimal metadata (year, author) without full book info.
-        Much faster than collect_all_books_with_metadata.
-        """
-        if self._year_index is not None and self._author_index is not None:
-            return
-        
-        if self._all_paths_cache is None:
-            self._all_paths_cache = self.collect_all_epub_paths()
-        
-        year_index = {}  # {year: [paths...]}
-        author_index = {}  # {author: [paths...]}
-        
-        for path in self._all_paths_cache:
-            relative_path = os.path.relpath(path, LIBRARY_DIR)
-            if self.security.has_path_traversal(relative_path) or not self.security.is_within_library_dir(path):
-                continue
-            
-            _, author, pub_date = self.metadata_extractor.extract_epub_metadata(path)
-            author = author or 'Unknown'
-            year = self._extract_year(pub_date)
-            
-            if year not in year_index:
-                year_index[year] = []
-            year_index[year].append(path)
-            
-            if author not in author_index:
-                author_index[author] = []
-            author_index[author].append(path)
-        
-        # Sort paths within each group by filename for consistent ordering
-        for paths in year_index.values():
-            paths.sort(key=lambda p: os.path.basename(p).lower())
-        for paths in author_index.values():
-            paths.sort(key=lambda p: os.path.basename(p).lower())
-        
-        self._year_index = year_index
-        self._author_index = author_index
+        index = self.get_library_index()
+        return index.books(range(len(index)))
 
     def get_years_with_counts(self) -> list[tuple[str, int]]:
         """Get all publication years with book counts.
         
         Returns list of (year, count) tuples sorted by year descending.
         """
-        self._build_year_author_indexes()
-        
-        year_counts = [(year, len(paths)) for year, paths in self._year_index.items()]
-        
-        # Sort years: known years descending, 'Unknown' at the end
-        sorted_years = sorted(
-            year_counts,
-            key=lambda x: (x[0] == 'Unknown', -int(x[0]) if x[0] != 'Unknown' else 0)
-        )
-        return sorted_years
-
-    def get_authors_with_counts(self) -> list[tuple[str, int]]:
-        """Get all authors with book counts.
-        
-        Returns list of (author, count) tuples sorted alphabetically.
-        """
-        self._build_year_author_indexes()
-        
-        author_counts = [(author, len(paths)) for author, paths in self._author_index.items()]
-        
-        # Sort authors alphabetically, 'Unknown' at the end
-        sorted_authors = sorted(
-            author_counts,
-            key=lambda x: (x[0] == 'Unknown', x[0].lower())
-        )
-        return sorted_authors
+        return self.get_library_index().year_counts
 
     def get_letters_with_author_counts(self) -> list[str]:
         """Get all letters A-Z plus '#' for navigation.
@@ -582,10 +1131,7 @@ class BookScanner:
         Returns list of letters for A-Z and '#' for special chars.
         No counting for performance.
         """
-        # Return all letters A-Z + '#' without counting
-        letters = [chr(i) for i in range(ord('A'), ord('Z') + 1)]
-        letters.append('#')
-        return letters
+        return list(self.AUTHOR_LETTERS)
 
     def get_authors_by_letter(self, letter: str, page: int, size: int) -> tuple[list[tuple[str, int]], int]:
         """Get paginated authors starting with a specific letter.
@@ -598,36 +1144,16 @@ class BookScanner:
         Returns:
             tuple: (list of (author, count) tuples, total count)
         """
-        all_authors = self.get_authors_with_counts()
-        
-        def matches_letter(author_name, target_letter):
-            if target_letter == '#':
-                if author_name == 'Unknown':
-                    return True
-                if not author_name:
-                    return True
-                return not author_name[0].upper().isalpha()
-            else:
-                if not author_name or author_name == 'Unknown':
-                    return False
-                return author_name[0].upper() == target_letter.upper()
-        
-        filtered_authors = [
-            (author, count) for author, count in all_authors
-            if matches_letter(author, letter)
-        ]
-        
-        total_count = len(filtered_authors)
+        bucket = self.get_library_index().authors_by_letter.get(letter.upper(), [])
         start = (page - 1) * size
         end = start + size
-        
-        return filtered_authors[start:end], total_count
+
+        return bucket[start:end], len(bucket)
 
     def get_books_for_year(self, year: str, page: int, size: int) -> tuple[list[dict], int]:
         """Get paginated books for a specific year.
         
-        Uses the same pattern as get_all_books_paginated: 
-        only extracts full metadata for the current page's books.
+        Served from the in-memory library index, like get_all_books_paginated.
         
         Args:
             year: Publication year string
@@ -637,39 +1163,17 @@ class BookScanner:
         Returns:
             tuple: (list of book dicts, total count)
         """
-        self._build_year_author_indexes()
-        
-        paths = self._year_index.get(year, [])
-        total_count = len(paths)
+        index = self.get_library_index()
+        positions = index.year_positions.get(year, [])
         
         start = (page - 1) * size
         end = start + size
-        paginated_paths = paths[start:end]
-        
-        # Only extract full metadata for current page (like get_all_books_paginated)
-        paginated_books = []
-        for path in paginated_paths:
-            relative_path = os.path.relpath(path, LIBRARY_DIR)
-            title, author, pub_date = self.metadata_extractor.extract_epub_metadata(path)
-            title = title or os.path.basename(path)
-            author = author or 'Unknown'
-            paginated_books.append({
-                'path': path,
-                'relative_path': relative_path,
-                'title': title,
-                'author': author,
-                'publication_date': pub_date,
-                'year': self._extract_year(pub_date),
-                'mtime': self._safe_getmtime(path),
-            })
-        
-        return paginated_books, total_count
+        return index.books(positions[start:end]), len(positions)
 
     def get_books_for_author(self, author: str, page: int, size: int) -> tuple[list[dict], int]:
         """Get paginated books for a specific author.
         
-        Uses the same pattern as get_all_books_paginated: 
-        only extracts full metadata for the current page's books.
+        Served from the in-memory library index, like get_all_books_paginated.
         
         Args:
             author: Author name
@@ -679,40 +1183,18 @@ class BookScanner:
         Returns:
             tuple: (list of book dicts, total count)
         """
-        self._build_year_author_indexes()
-        
-        paths = self._author_index.get(author, [])
-        total_count = len(paths)
+        index = self.get_library_index()
+        positions = index.author_positions.get(author, [])
         
         start = (page - 1) * size
         end = start + size
-        paginated_paths = paths[start:end]
-        
-        # Only extract full metadata for current page (like get_all_books_paginated)
-        paginated_books = []
-        for path in paginated_paths:
-            relative_path = os.path.relpath(path, LIBRARY_DIR)
-            title, book_author, pub_date = self.metadata_extractor.extract_epub_metadata(path)
-            title = title or os.path.basename(path)
-            book_author = book_author or 'Unknown'
-            paginated_books.append({
-                'path': path,
-                'relative_path': relative_path,
-                'title': title,
-                'author': book_author,
-                'publication_date': pub_date,
-                'year': self._extract_year(pub_date),
-                'mtime': self._safe_getmtime(path),
-            })
-        
-        return paginated_books, total_count
+        return index.books(positions[start:end]), len(positions)
 
     def search_books(self, query: str, page: int, size: int) -> tuple[list[dict], int]:
         """Search books by title or author.
         
         Performs case-insensitive search across both title and author fields.
-        Uses the same pattern as get_all_books_paginated: 
-        only extracts full metadata for the current page's books.
+        Served from the in-memory library index, like get_all_books_paginated.
         
         Args:
             query: Search query string
@@ -729,70 +1211,63 @@ class BookScanner:
             # Empty query returns all books
             return self.get_all_books_paginated(page, size)
         
-        if self._all_paths_cache is None:
-            self._all_paths_cache = self.collect_all_epub_paths()
-        
-        # First pass: find all matching paths
-        matching_paths = []
-        for path in self._all_paths_cache:
-            relative_path = os.path.relpath(path, LIBRARY_DIR)
-            if self.security.has_path_traversal(relative_path) or not self.security.is_within_library_dir(path):
-                continue
-            
-            # Extract metadata to check if it matches
-            title, author, pub_date = self.metadata_extractor.extract_epub_metadata(path)
-            title = title or os.path.basename(path)
-            author = author or 'Unknown'
-            
-            # Case-insensitive partial match in title or author
-            if query_lower in title.lower() or query_lower in author.lower():
-                matching_paths.append(path)
-        
-        total_count = len(matching_paths)
+        index = self.get_library_index()
+        matching_positions = [
+            position
+            for position, (title, author) in enumerate(zip(index.search_titles, index.search_authors))
+            if query_lower in title or query_lower in author
+        ]
         
-        # Paginate the results
         start = (page - 1) * size
         end = start + size
-        paginated_paths = matching_paths[start:end]
-        
-        # Extract full metadata for paginated results only
-        paginated_books = []
-        for path in paginated_paths:
-            relative_path = os.path.relpath(path, LIBRARY_DIR)
-            title, author, pub_date = self.metadata_extractor.extract_epub_metadata(path)
-            title = title or os.path.basename(path)
-            author = author or 'Unknown'
-            paginated_books.append({
-                'path': path,
-                'relative_path': relative_path,
-                'title': title,
-                'author': author,
-                'publication_date': pub_date,
-                'mtime': self._safe_getmtime(path),
-            })
-        
-        return paginated_books, total_count
+        return index.books(matching_positions[start:end]), len(matching_positions)
 
 
 class OPDSController:
     """Controller for OPDS catalog operations."""
 
+    # Stateless helpers shared by every request instead of built per controller
+    feed_generator = OPDSFeedGenerator()
+    security = SecurityUtils()
+
+    # Encoded OpenSearch descriptions by Host header; bounded since the header is client-controlled
+    _opensearch_cache = TTLCache(maxsize=32, ttl=MEMORY_CACHE_TTL)
+
+    # First page of each author letter, quoted once for the letter catalog and its facets
+    _AUTHOR_LETTER_URLS = {
+        letter: f'/opds/by-author/letter/{quote(letter)}?page=1'
+        for letter in BookScanner.AUTHOR_LETTERS
+    }
+
+    # Letter facet links are identical on every author-letter page
+    _AUTHOR_LETTER_FACETS = tuple(
+        (
+            f'http://opds-spec.org/facet#{letter}',
+            url,
+            'application/atom+xml;profile=opds-catalog;kind=navigation',
+        )
+        for letter, url in _AUTHOR_LETTER_URLS.items()
+    )
+
     def __init__(self, request_handler):
         self.request = request_handler
-        self.feed_generator = OPDSFeedGenerator()
         self.book_scanner = BookScanner.get_instance()  # Use singleton
-        self.security = SecurityUtils()
+        # Cache generation seen by _send_cached_feed, reused when the built feed is stored
+        self._feed_generation = None
 
     def _parse_url_params(self):
         """Parse URL parameters for pagination."""
         parsed_url = urlparse(self.request.path)
-        query_params = parse_qs(parsed_url.query)
 
-        try:
-            page = int(query_params.get('page', ['1'])[0])
-            page = max(1, min(page, 10000))  # Limit to reasonable range
-        except ValueError:
-            page = 1
+        # Only 'page' is needed, so scan for it instead of decoding every field with parse_qs
+        page = 1
+        for field in parsed_url.query.split('&'):
+            if field.startswith('page='):
+                try:
+                    page = max(1, min(int(field[5:]), 10000))  # Limit to reasonable range
+                except ValueError:
+                    page = 1
+                break
 
         size = PAGE_SIZE
 
@@ -877,6 +1352,14 @@ class OPDSController:
         self.request.end_headers()
 
     def _handle_root_catalog(self):
+        # Top-level folders only change when LIBRARY_DIR's own mtime does
+        try:
+            cache_key = (self.request.path, os.stat(LIBRARY_DIR).st_mtime_ns)
+        except OSError:
+            cache_key = (self.request.path, None)
+        if self._send_cached_feed(cache_key, 'navigation'):
+            return
+
         links = [
             (
                 'self',
@@ -898,7 +1381,7 @@ class OPDSController:
         entries = self._get_root_entries()
         xml = self.feed_generator.generate_feed('My Library', 'urn:library-root', links, entries)
 
-        self._send_xml_response(xml, 'navigation')
+        self._send_feed_and_cache(cache_key, xml, 'navigation')
 
     def _get_root_entries(self):
         entries = [
@@ -948,35 +1431,40 @@ class OPDSController:
             },
         ]
 
+        with os.scandir(LIBRARY_DIR) as dir_entries:
+            folders = sorted(entry.name for entry in dir_entries if entry.is_dir())
 
-        for folder in sorted(os.listdir(LIBRARY_DIR)):
-            folder_path = os.path.join(LIBRARY_DIR, folder)
-            if os.path.isdir(folder_path):
-                folder_id = f'urn:folder:{hashlib.md5(folder.encode()).hexdigest()}'
-                encoded_folder = quote(folder)
-                entries.append(
-                    {
-                        'title': folder,
-                        'id': folder_id,
-                        'links': [
-                            (
-                                'subsection',
-                                f'/opds/folder/{encoded_folder}?page=1',
-                                'application/atom+xml;profile=opds-catalog;kind=acquisition',
-                            )
-                        ],
-                    }
-                )
+        for folder in folders:
+            folder_id = f'urn:folder:{opaque_id(folder)}'
+            encoded_folder = quote(folder)
+            entries.append(
+                {
+                    'title': folder,
+                    'id': folder_id,
+                    'links': [
+                        (
+                            'subsection',
+                            f'/opds/folder/{encoded_folder}?page=1',
+                            'application/atom+xml;profile=opds-catalog;kind=acquisition',
+                        )
+                    ],
+                }
+            )
 
         return entries
 
     def _handle_all_books(self):
+        cache_key = self.request.path
+        if self._send_cached_feed(cache_key, 'acquisition'):
+            return
+
         page, size, parsed_url = self._parse_url_params()
         path_base = parsed_url.path
 
         paginated_books, total_count = self.book_scanner.get_all_books_paginated(page, size)
 
-        links = self._get_pagination_links(path_base, page, size, total_count)
+        total_pages = self._get_total_pages(total_count, size)
+        links = self._get_pagination_links(path_base, page, total_pages)
         links.append(
             (
                 'start',
@@ -987,13 +1475,16 @@ class OPDSController:
 
         entries = self._create_book_entries(paginated_books)
 
-        total_pages = self._get_total_pages(total_count, size)
         title = f'All Books (Page {page} of {total_pages})'
         xml = self.feed_generator.generate_feed(title, 'urn:all-books', links, entries)
 
-        self._send_xml_response(xml, 'acquisition')
+        self._send_feed_and_cache(cache_key, xml, 'acquisition')
 
     def _handle_recent_books(self):
+        cache_key = self.request.path
+        if self._send_cached_feed(cache_key, 'acquisition'):
+            return
+
         links = [
             (
                 'self',
@@ -1011,18 +1502,26 @@ class OPDSController:
         entries = self._create_book_entries(file_list)
         xml = self.feed_generator.generate_feed('Recent Books', 'urn:recent-books', links, entries)
 
-        self._send_xml_response(xml, 'acquisition')
+        self._send_feed_and_cache(cache_key, xml, 'acquisition')
 
     def _handle_folder_catalog(self):
         page, size, parsed_url = self._parse_url_params()
 
         folder_path = unquote(parsed_url.path[len('/opds/folder/'):])
         path_base = parsed_url.path
-        folder_full_path = os.path.join(LIBRARY_DIR, folder_path)
+        folder_full_path = _LIBRARY_DIR_PREFIX + folder_path
 
         if not self._validate_folder_access(folder_full_path):
             return
 
+        # Adding or removing entries bumps the directory mtime, which keys a fresh feed
+        try:
+            cache_key = (self.request.path, os.stat(folder_full_path).st_mtime_ns)
+        except OSError:
+            cache_key = (self.request.path, None)
+        if self._send_cached_feed(cache_key, 'acquisition'):
+            return
+
         paginated_entries, total_count = self.book_scanner.get_folder_content_paginated(
             folder_full_path,
             folder_path,
@@ -1051,7 +1550,8 @@ class OPDSController:
                     }
                 )
 
-        links = self._get_pagination_links(path_base, page, size, total_count)
+        total_pages = self._get_total_pages(total_count, size)
+        links = self._get_pagination_links(path_base, page, total_pages)
         links.append(
             (
                 'start',
@@ -1060,19 +1560,23 @@ class OPDSController:
             )
         )
 
-        feed_id = f'urn:folder:{hashlib.md5(folder_path.encode()).hexdigest()}'
+        feed_id = f'urn:folder:{opaque_id(folder_path)}'
         title = os.path.basename(folder_path) or 'Library'
 
-        total_pages = self._get_total_pages(total_count, size)
         if total_pages > 1:
             title = f'{title} (Page {page} of {total_pages})'
 
         xml = self.feed_generator.generate_feed(title, feed_id, links, formatted_entries)
 
-        self._send_xml_response(xml, 'acquisition')
+        self._send_feed_and_cache(cache_key, xml, 'acquisition')
 
     def _handle_by_year_catalog(self):
         """Handle display of years catalog."""
+        # Index-derived feeds are cached by request path; invalidate_caches() clears them
+        cache_key = self.request.path
+        if self._send_cached_feed(cache_key, 'navigation'):
+            return
+
         links = [
             (
                 'self',
@@ -1104,17 +1608,22 @@ class OPDSController:
             })
 
         xml = self.feed_generator.generate_feed('By Year', 'urn:by-year', links, entries)
-        self._send_xml_response(xml, 'navigation')
+        self._send_feed_and_cache(cache_key, xml, 'navigation')
 
     def _handle_year_books(self):
         """Handle display of books for a specific year."""
+        cache_key = self.request.path
+        if self._send_cached_feed(cache_key, 'acquisition'):
+            return
+
         page, size, parsed_url = self._parse_url_params()
         year = unquote(parsed_url.path[len('/opds/by-year/'):])
         path_base = parsed_url.path
 
         paginated_books, total_count = self.book_scanner.get_books_for_year(year, page, size)
 
-        links = self._get_pagination_links(path_base, page, size, total_count)
+        total_pages = self._get_total_pages(total_count, size)
+        links = self._get_pagination_links(path_base, page, total_pages)
         links.append(
             (
                 'start',
@@ -1132,16 +1641,19 @@ class OPDSController:
 
         entries = self._create_book_entries(paginated_books)
 
-        total_pages = self._get_total_pages(total_count, size)
         title = f'Year {year}'
         if total_pages > 1:
             title = f'{title} (Page {page} of {total_pages})'
 
         xml = self.feed_generator.generate_feed(title, f'urn:year:{year}', links, entries)
-        self._send_xml_response(xml, 'acquisition')
+        self._send_feed_and_cache(cache_key, xml, 'acquisition')
 
     def _handle_by_author_catalog(self):
         """Handle display of letters catalog for authors."""
+        cache_key = self.request.path
+        if self._send_cached_feed(cache_key, 'navigation'):
+            return
+
         links = [
             (
                 'self',
@@ -1159,7 +1671,6 @@ class OPDSController:
         entries = []
         for letter in letters:
             letter_id = f'urn:author-letter:{letter}'
-            encoded_letter = quote(letter)
             display_letter = letter if letter != '#' else '# (Autres)'
             entries.append({
                 'title': display_letter,
@@ -1167,24 +1678,29 @@ class OPDSController:
                 'links': [
                     (
                         'subsection',
-                        f'/opds/by-author/letter/{encoded_letter}?page=1',
+                        self._AUTHOR_LETTER_URLS[letter],
                         'application/atom+xml;profile=opds-catalog;kind=navigation',
                     )
                 ],
             })
 
         xml = self.feed_generator.generate_feed('By Author', 'urn:by-author', links, entries)
-        self._send_xml_response(xml, 'navigation')
+        self._send_feed_and_cache(cache_key, xml, 'navigation')
 
     def _handle_author_letter_catalog(self):
         """Handle display of authors for a specific letter."""
+        cache_key = self.request.path
+        if self._send_cached_feed(cache_key, 'navigation'):
+            return
+
         page, size, parsed_url = self._parse_url_params()
         letter = unquote(parsed_url.path[len('/opds/by-author/letter/'):])
         path_base = parsed_url.path
 
         paginated_authors, total_count = self.book_scanner.get_authors_by_letter(letter, page, size)
 
-        links = self._get_pagination_links(path_base, page, size, total_count)
+        total_pages = self._get_total_pages(total_count, size)
+        links = self._get_pagination_links(path_base, page, total_pages)
         links.append(
             (
                 'start',
@@ -1201,20 +1717,11 @@ class OPDSController:
         )
 
         # Add letter navigation links
-        all_letters = self.book_scanner.get_letters_with_author_counts()
-        for nav_letter in all_letters:
-            encoded_nav_letter = quote(nav_letter)
-            links.append(
-                (
-                    f'http://opds-spec.org/facet#{nav_letter}',
-                    f'/opds/by-author/letter/{encoded_nav_letter}?page=1',
-                    'application/atom+xml;profile=opds-catalog;kind=navigation',
-                )
-            )
+        links.extend(self._AUTHOR_LETTER_FACETS)
 
         entries = []
         for author, count in paginated_authors:
-            author_id = f'urn:author:{hashlib.md5(author.encode()).hexdigest()}'
+            author_id = f'urn:author:{opaque_id(author)}'
             encoded_author = quote(author)
             entries.append({
                 'title': f'{author} ({count} livres)',
@@ -1228,24 +1735,28 @@ class OPDSController:
                 ],
             })
 
-        total_pages = self._get_total_pages(total_count, size)
         display_letter = letter if letter != '#' else '# (Autres)'
         title = f'Auteurs - {display_letter}'
         if total_pages > 1:
             title = f'{title} (Page {page} of {total_pages})'
 
         xml = self.feed_generator.generate_feed(title, f'urn:author-letter:{letter}', links, entries)
-        self._send_xml_response(xml, 'navigation')
+        self._send_feed_and_cache(cache_key, xml, 'navigation')
 
     def _handle_author_books(self):
         """Handle display of books for a specific author."""
+        cache_key = self.request.path
+        if self._send_cached_feed(cache_key, 'acquisition'):
+            return
+
         page, size, parsed_url = self._parse_url_params()
         author = unquote(parsed_url.path[len('/opds/by-author/'):])
         path_base = parsed_url.path
 
         paginated_books, total_count = self.book_scanner.get_books_for_author(author, page, size)
 
-        links = self._get_pagination_links(path_base, page, size, total_count)
+        total_pages = self._get_total_pages(total_count, size)
+        links = self._get_pagination_links(path_base, page, total_pages)
         links.append(
             (
                 'start',
@@ -1263,24 +1774,21 @@ class OPDSController:
 
         entries = self._create_book_entries(paginated_books)
 
-        total_pages = self._get_total_pages(total_count, size)
         title = author
         if total_pages > 1:
             title = f'{title} (Page {page} of {total_pages})'
 
-        xml = self.feed_generator.generate_feed(title, f'urn:author:{hashlib.md5(author.encode()).hexdigest()}', links, entries)
-        self._send_xml_response(xml, 'acquisition')
+        xml = self.feed_generator.generate_feed(title, f'urn:author:{opaque_id(author)}', links, entries)
+        self._send_feed_and_cache(cache_key, xml, 'acquisition')
 
     def _get_total_pages(self, total_count, size=None):
         if size is None:
             size = PAGE_SIZE
         return max(1, (total_count + size - 1) // size)
 
-    def _get_pagination_links(self, path_base, current_page, size, total_count):
+    def _get_pagination_links(self, path_base, current_page, total_pages):
         links = []
 
-        total_pages = self._get_total_pages(total_count, size)
-
         links.append(
             (
                 'self',
@@ -1336,8 +1844,7 @@ class OPDSController:
     def _create_book_entries(self, file_list):
         entries = []
         for file_info in file_list:
-            book_id = f'urn:book:{hashlib.md5(file_info["relative_path"].encode()).hexdigest()}'
-            encoded_path = quote(file_info['relative_path'].replace(os.sep, '/'))
+            book_id, encoded_path = book_link_fields(file_info['relative_path'])
 
             entry_links = [
                 (
@@ -1365,7 +1872,7 @@ class OPDSController:
             self._send_error(403, 'Access denied: Invalid path')
             return
 
-        file_path = os.path.join(LIBRARY_DIR, filename)
+        file_path = _LIBRARY_DIR_PREFIX + filename
 
         if not self.security.is_within_library_dir(file_path):
             self._send_error(403, 'Access denied: Path traversal detected')
@@ -1407,10 +1914,18 @@ class OPDSController:
         self.request.send_header('Content-Length', str(file_size))
         self.request.end_headers()
 
-        # Stream file in chunks to avoid loading entire file into memory
         with open(file_path, 'rb') as f:
-            while chunk := f.read(8192):  # 8KB chunks
-                self.request.wfile.write(chunk)
+            self._send_file_contents(f, file_size)
+
+    def _send_file_contents(self, f, count):
+        """Copy count bytes of an open file to the client.
+
+        socket.sendfile() uses os.sendfile() where available so the kernel
+        copies straight from the page cache, and falls back to a send loop
+        elsewhere. Buffered headers must be flushed first.
+        """
+        self.request.wfile.flush()
+        self.request.connection.sendfile(f, 0, count)
 
     def _handle_cover_download(self):
         """Handle cover image download requests."""
@@ -1420,38 +1935,78 @@ class OPDSController:
             self._send_error(403, 'Access denied: Invalid path')
             return
 
-        file_path = os.path.join(LIBRARY_DIR, filename)
+        file_path = _LIBRARY_DIR_PREFIX + filename
 
         if not self.security.is_within_library_dir(file_path):
             self._send_error(403, 'Access denied: Path traversal detected')
             return
 
-        if not filename.endswith('.epub') or not os.path.exists(file_path):
+        try:
+            st = os.stat(file_path) if filename.endswith('.epub') else None
+        except OSError:
+            st = None
+        if st is None:
             self._send_error(404, 'File not found')
             return
 
-        # Extract cover from EPUB
-        cover_data, mime_type = BookMetadata.extract_epub_cover(file_path)
+        # The cover can only change along with the book that contains it
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        if self._etag_matches(etag):
+            self._send_not_modified(etag)
+            return
+
+        cover_path, mime_type, entry = self.book_scanner.metadata_extractor.locate_epub_cover(file_path, st)
+
+        if cover_path is None:
+            self._send_error(404, 'Cover not found in EPUB')
+            return
+
+        if entry is not None:
+            # Seek straight to the cached entry instead of re-reading the central directory
+            try:
+                chunks = BookMetadata.iter_zip_entry(file_path, entry)
+            except (OSError, zipfile.BadZipFile):
+                self._send_error(404, 'Cover not found in EPUB')
+                return
+            self._send_cover_headers(mime_type, entry[3], etag)
+            for chunk in chunks:
+                self.request.wfile.write(chunk)
+            return
 
-        if cover_data is None:
+        # Stream the cover straight out of the archive
+        try:
+            zf = zipfile.ZipFile(file_path)
+        except (OSError, zipfile.BadZipFile):
             self._send_error(404, 'Cover not found in EPUB')
             return
+        with zf:
+            try:
+                cover_size = zf.getinfo(cover_path).file_size
+            except KeyError:
+                self._send_error(404, 'Cover not found in EPUB')
+                return
+            self._send_cover_headers(mime_type, cover_size, etag)
+            with zf.open(cover_path) as cover:
+                shutil.copyfileobj(cover, self.request.wfile, 64 * 1024)
 
-        # Serve the cover image
+    def _send_cover_headers(self, mime_type, size, etag):
         self.request.send_response(200)
         self.request.send_header('Content-Type', mime_type)
+        self.request.send_header('Content-Length', str(size))
         self.request.send_header('Cache-Control', 'public, max-age=86400')
+        self.request.send_header('ETag', etag)
         self.request.end_headers()
-        self.request.wfile.write(cover_data)
 
     def _handle_opensearch_description(self):
         """Generate and serve OpenSearch description document."""
         # Get the host from the request headers
         host = self.request.headers.get('Host', 'localhost:8080')
-        scheme = 'http'  # Could be enhanced to detect HTTPS
-        base_url = f'{scheme}://{host}'
-        
-        opensearch_xml = f'''<?xml version="1.0" encoding="UTF-8"?>
+        body = self._opensearch_cache.get(host)
+        if body is None:
+            scheme = 'http'  # Could be enhanced to detect HTTPS
+            base_url = xml_escape(f'{scheme}://{host}', _XML_ATTR_ENTITIES)
+
+            opensearch_xml = f'''<?xml version="1.0" encoding="UTF-8"?>
 <OpenSearchDescription xmlns="http://a9.com/-/spec/opensearch/1.1/">
   <ShortName>PyOPDS</ShortName>
   <Description>Search books in PyOPDS catalog</Description>
@@ -1459,8 +2014,10 @@ class OPDSController:
   <Url type="application/atom+xml;profile=opds-catalog;kind=acquisition" 
        template="{base_url}/opds/search?q={{searchTerms}}&amp;page={{startPage?}}"/>
 </OpenSearchDescription>'''
-        
-        body = opensearch_xml.encode('utf-8')
+
+            body = opensearch_xml.encode('utf-8')
+            self._opensearch_cache.set(host, body)
+
         self.request.send_response(200)
         self.request.send_header('Content-Type', 'application/opensearchdescription+xml')
         self.request.send_header('Content-Length', str(len(body)))
@@ -1483,9 +2040,10 @@ class OPDSController:
         links = []
         
         total_pages = self._get_total_pages(total_count, size)
+        encoded_query = quote(query)
         
         # Self link with query
-        query_string = f'q={quote(query)}&page={page}'
+        query_string = f'q={encoded_query}&page={page}'
         links.append(
             (
                 'self',
@@ -1505,7 +2063,7 @@ class OPDSController:
         
         # Pagination links
         if page < total_pages:
-            next_query = f'q={quote(query)}&page={page + 1}'
+            next_query = f'q={encoded_query}&page={page + 1}'
             links.append(
                 (
                     'next',
@@ -1515,7 +2073,7 @@ class OPDSController:
             )
         
         if page > 1:
-            prev_query = f'q={quote(query)}&page={page - 1}'
+            prev_query = f'q={encoded_query}&page={page - 1}'
             links.append(
                 (
                     'previous',
@@ -1525,8 +2083,8 @@ class OPDSController:
             )
         
         if total_pages > 1:
-            first_query = f'q={quote(query)}&page=1'
-            last_query = f'q={quote(query)}&page={total_pages}'
+            first_query = f'q={encoded_query}&page=1'
+            last_query = f'q={encoded_query}&page={total_pages}'
             links.append(
                 (
                     'first',
@@ -1554,7 +2112,7 @@ class OPDSController:
             title = f'All Books (Page {page} of {total_pages})'
         
         # Generate feed
-        feed_id = f'urn:search:{hashlib.md5(query.encode()).hexdigest()}'
+        feed_id = f'urn:search:{opaque_id(query)}'
         xml = self.feed_generator.generate_feed(title, feed_id, links, entries)
         
         self._send_xml_response(xml, 'acquisition')
@@ -1566,22 +2124,65 @@ class OPDSController:
                 self._send_error(404, "XSLT file not found")
                 return
 
-            self.request.send_response(200)
-            self.request.send_header('Content-Type', 'application/xml')
-            self.request.end_headers()
             with open(xslt_path, 'rb') as f:
-                self.request.wfile.write(f.read())
+                size = os.fstat(f.fileno()).st_size
+                self.request.send_response(200)
+                self.request.send_header('Content-Type', 'application/xml')
+                self.request.send_header('Content-Length', str(size))
+                self.request.end_headers()
+                self._send_file_contents(f, size)
         except Exception as exc:
             self._send_error(500, f"Error serving XSLT file: {exc}")
 
-    def _send_xml_response(self, xml, catalog_kind):
-        body = xml.encode('utf-8')
-        self.request.send_response(200)
-        self.request.send_header(
-            'Content-Type',
-            f'application/xml;profile=opds-catalog;kind={catalog_kind}',
+    @staticmethod
+    def _compute_etag(body):
+        return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+    def _etag_matches(self, etag):
+        """Return True if the request's If-None-Match header covers etag."""
+        if_none_match = self.request.headers.get('If-None-Match')
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        return any(
+            candidate.strip().removeprefix('W/') == etag
+            for candidate in if_none_match.split(',')
         )
+
+    def _send_not_modified(self, etag):
+        self.request.send_response(304)
+        self.request.send_header('ETag', etag)
+        self.request.end_headers()
+
+    def _send_cached_feed(self, cache_key, catalog_kind):
+        """Serve a memoized feed if there is one. Returns True when a response was sent."""
+        self._feed_generation = self.book_scanner.cache_generation
+        cached = self.book_scanner.feed_cache.get((self._feed_generation, cache_key))
+        if cached is None:
+            return False
+        body, etag = cached
+        self._send_xml_response(body, catalog_kind, etag=etag)
+        return True
+
+    def _send_feed_and_cache(self, cache_key, body, catalog_kind):
+        etag = self._compute_etag(body)
+        # Stored under the generation read before the feed was built: if the
+        # watcher swapped the index meanwhile, this body is never served again.
+        self.book_scanner.feed_cache.set((self._feed_generation, cache_key), (body, etag))
+        self._send_xml_response(body, catalog_kind, etag=etag)
+
+    def _send_xml_response(self, body, catalog_kind, etag=None):
+        if etag is None:
+            etag = self._compute_etag(body)
+        if self._etag_matches(etag):
+            self._send_not_modified(etag)
+            return
+
+        self.request.send_response(200)
+        self.request.send_header('Content-Type', _FEED_CONTENT_TYPES[catalog_kind])
         self.request.send_header('Content-Length', str(len(body)))
+        self.request.send_header('ETag', etag)
         self.request.end_headers()
         self.request.wfile.write(body)
 
@@ -1600,9 +2201,13 @@ class OPDSController:
 __all__ = [
     'LIBRARY_DIR',
     'PAGE_SIZE',
+    'METADATA_CACHE_DB_PATH',
+    'LIBRARY_POLL_INTERVAL',
     'OPDSController',
     'BookMetadata',
+    'MetadataCache',
     'SecurityUtils',
     'OPDSFeedGenerator',
     'BookScanner',
+    'LibraryIndex',
 ]
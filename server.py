@@ -4,7 +4,7 @@ import socketserver
 from urllib.parse import urlparse
 
 from controllers.koreader_sync import KoReaderSyncController
-from controllers.opds import LIBRARY_DIR, OPDSController, PAGE_SIZE
+from controllers.opds import LIBRARY_DIR, BookScanner, OPDSController, PAGE_SIZE
 from routes import Router, register_routes
 
 PORT = int(os.environ.get('PORT', 8080))
@@ -18,6 +18,12 @@ class UnifiedHandler(http.server.BaseHTTPRequestHandler):
     # Initialize router with all routes
     router = register_routes(Router())
 
+    # Buffer writes so the status line, headers and a small body leave in a
+    # single send() when the request completes, instead of one syscall per
+    # write; the buffer is flushed by handle_one_request().
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
     def __init__(self, *args, **kwargs):
         """Initialize handler with controller instances."""
         super().__init__(*args, **kwargs)
@@ -67,6 +73,9 @@ def main():
     if not os.path.exists(LIBRARY_DIR):
         os.makedirs(LIBRARY_DIR)
 
+    # Build the library index in the background and keep it up to date
+    BookScanner.get_instance().start_library_watcher()
+
     print(f"\nAccess the root catalog at http://127.0.0.1:{PORT}/opds")
     print(f"KoReader sync available at http://127.0.0.1:{PORT}/koreader/sync\n")
 
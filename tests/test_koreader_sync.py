@@ -2,9 +2,11 @@ import base64
 import hashlib
 import http.client
 import importlib
+import io
 import json
 import os
 import socketserver
+import sqlite3
 import sys
 import tempfile
 import threading
@@ -21,9 +23,11 @@ if PROJECT_ROOT not in sys.path:
 
 # Pas d'import de server ici pour éviter des problèmes d'identité de classes
 
+
 class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     allow_reuse_address = True
 
+
 class TestKoReaderSync(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -53,8 +57,9 @@ class TestKoReaderSync(unittest.TestCase):
         cls.httpd.shutdown()
         cls.httpd.server_close()
         cls.thread.join(timeout=1)
-        if os.path.exists(TEMP_DB.name):
-            os.unlink(TEMP_DB.name)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(TEMP_DB.name + suffix):
+                os.unlink(TEMP_DB.name + suffix)
 
     @staticmethod
     def _basic_auth_header(username, password_md5):
@@ -69,6 +74,13 @@ class TestKoReaderSync(unittest.TestCase):
             headers.setdefault('Authorization', self._basic_auth_header(u, p))
         return headers
 
+    def _sync_headers(self):
+        return {
+            'X-Auth-User': self.username,
+            'X-Auth-Key': self.password_md5,
+            'Content-Type': 'application/json',
+        }
+
     def _post_json(self, path, body, include_auth=True, username=None, password_md5=None):
         conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
         headers = self._auth_headers({'Content-Type': 'application/json'}, include_auth=include_auth, username=username, password_md5=password_md5)
@@ -150,11 +162,7 @@ class TestKoReaderSync(unittest.TestCase):
             'device': 'ereader',
             'device_id': 'dev123',
         }
-        headers = {
-            'X-Auth-User': self.username,
-            'X-Auth-Key': self.password_md5,
-            'Content-Type': 'application/json',
-        }
+        headers = self._sync_headers()
         conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
         conn.request('PUT', '/koreader/sync/syncs/progress', body=json.dumps(payload), headers=headers)
         response = conn.getresponse()
@@ -175,6 +183,108 @@ class TestKoReaderSync(unittest.TestCase):
         self.assertEqual(data['device_id'], 'dev123')
         self.assertEqual(data['percentage'], 50)
 
+    def test_store_overwrites_previous_progress(self):
+        headers = self._sync_headers()
+        for percentage, progress in ((10, 'page:2'), (75, 'page:30')):
+            payload = {
+                'document': 'book3.epub',
+                'percentage': percentage,
+                'progress': progress,
+                'device': 'ereader',
+                'device_id': 'dev123',
+            }
+            conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+            conn.request('PUT', '/koreader/sync/syncs/progress', body=json.dumps(payload), headers=headers)
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            self.assertEqual(response.status, 200)
+
+        conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+        conn.request('GET', '/koreader/sync/syncs/progress/book3.epub', headers=headers)
+        response = conn.getresponse()
+        data = json.loads(response.read().decode('utf-8'))
+        conn.close()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(data['percentage'], 75)
+        self.assertEqual(data['progress'], 'page:30')
+
+    def test_store_accepts_a_batch_of_records(self):
+        headers = self._sync_headers()
+        payload = [
+            {'document': 'batch1.epub', 'percentage': 0.2, 'progress': 'page:4', 'device': 'ereader'},
+            {'document': 'batch2.epub', 'percentage': 0.9, 'progress': 'page:90', 'device': 'ereader'},
+        ]
+        conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+        conn.request('PUT', '/koreader/sync/syncs/progress', body=json.dumps(payload), headers=headers)
+        response = conn.getresponse()
+        data = json.loads(response.read().decode('utf-8'))
+        conn.close()
+        self.assertEqual(response.status, 200)
+        self.assertEqual([item['document'] for item in data], ['batch1.epub', 'batch2.epub'])
+
+        conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+        conn.request('GET', '/koreader/sync/syncs/progress/batch2.epub', headers=headers)
+        response = conn.getresponse()
+        data = json.loads(response.read().decode('utf-8'))
+        conn.close()
+        self.assertEqual(data['progress'], 'page:90')
+
+    def test_store_keeps_client_timestamp(self):
+        headers = self._sync_headers()
+        payload = {
+            'document': 'book4.epub',
+            'percentage': 0.5,
+            'progress': 'page:5',
+            'device': 'ereader',
+            'timestamp': 1700000000,
+        }
+        conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+        conn.request('PUT', '/koreader/sync/syncs/progress', body=json.dumps(payload), headers=headers)
+        response = conn.getresponse()
+        data = json.loads(response.read().decode('utf-8'))
+        conn.close()
+        self.assertEqual(data['timestamp'], 1700000000)
+
+        payload['timestamp'] = time.time() + 10 * 86400
+        conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+        conn.request('PUT', '/koreader/sync/syncs/progress', body=json.dumps(payload), headers=headers)
+        response = conn.getresponse()
+        data = json.loads(response.read().decode('utf-8'))
+        conn.close()
+        self.assertLessEqual(data['timestamp'], time.time() + 3600)
+
+    def test_store_replaces_non_finite_client_timestamp(self):
+        headers = self._sync_headers()
+
+        def reject_constant(name):
+            raise ValueError(f'non-standard JSON constant {name}')
+
+        for document, timestamp in (('book5.epub', float('nan')), ('book6.epub', float('inf'))):
+            payload = {
+                'document': document,
+                'percentage': 0.5,
+                'progress': 'page:5',
+                'device': 'ereader',
+                'timestamp': timestamp,
+            }
+            before = time.time()
+            conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+            conn.request('PUT', '/koreader/sync/syncs/progress', body=json.dumps(payload), headers=headers)
+            response = conn.getresponse()
+            data = json.loads(response.read().decode('utf-8'), parse_constant=reject_constant)
+            conn.close()
+            self.assertEqual(response.status, 200)
+            self.assertGreaterEqual(data['timestamp'], before)
+            self.assertLessEqual(data['timestamp'], time.time())
+
+            conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+            conn.request('GET', f'/koreader/sync/syncs/progress/{document}', headers=headers)
+            response = conn.getresponse()
+            data = json.loads(response.read().decode('utf-8'), parse_constant=reject_constant)
+            conn.close()
+            self.assertGreaterEqual(data['timestamp'], before)
+
     def test_requires_authentication(self):
         payload = {
             'document': 'book2.epub',
@@ -209,5 +319,92 @@ class TestKoReaderSync(unittest.TestCase):
         except http.client.BadStatusLine:
             pass
 
+
+class TestKoReaderSyncStorage(unittest.TestCase):
+    def setUp(self):
+        from controllers.koreader_sync import KoReaderSyncStorage
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.storage = KoReaderSyncStorage(os.path.join(self.tmpdir.name, 'sync.db'))
+
+    def tearDown(self):
+        self.storage._conn.close()
+        self.tmpdir.cleanup()
+
+    def test_progress_lookup_uses_primary_key_without_extra_index(self):
+        from controllers.koreader_sync import KoReaderSyncStorage, _SQL_FETCH_LATEST
+        # A database from an earlier version still has the (user, timestamp) index
+        self.storage._conn.execute('CREATE INDEX idx_sync_user_ts ON sync_records (user, timestamp)')
+        self.storage._conn.close()
+        self.storage = KoReaderSyncStorage(os.path.join(self.tmpdir.name, 'sync.db'))
+        with self.storage._get_connection() as conn:
+            plan = ' '.join(row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + _SQL_FETCH_LATEST, ('alice', 'book')))
+            indexes = [row[1] for row in conn.execute("PRAGMA index_list('sync_records')")]
+        self.assertIn('sqlite_autoindex_sync_records_1', plan)
+        self.assertNotIn('idx_sync_user_ts', indexes)
+
+    def test_verify_user_cache_does_not_accept_other_passwords(self):
+        self.assertTrue(self.storage.create_user('carol', 'good'))
+        self.assertTrue(self.storage.verify_user('carol', 'good'))
+        self.assertTrue(self.storage.verify_user('carol', 'good'))
+        self.assertFalse(self.storage.verify_user('carol', 'bad'))
+        self.assertFalse(self.storage.verify_user('dave', 'good'))
+
+    def test_failed_commit_does_not_leave_transaction_open(self):
+        conn = self.storage._conn
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.execute('CREATE TABLE parent (id INTEGER PRIMARY KEY)')
+        conn.execute(
+            'CREATE TABLE child (parent_id INTEGER REFERENCES parent(id) DEFERRABLE INITIALLY DEFERRED)'
+        )
+        # A deferred foreign key violation is only reported by COMMIT
+        with self.assertRaises(sqlite3.IntegrityError):
+            with self.storage._transaction() as tx:
+                tx.execute('INSERT INTO child (parent_id) VALUES (42)')
+        self.assertFalse(conn.in_transaction)
+
+        self.storage.upsert_record('alice', 'book.epub', 0.5, 'page:5', 'ereader', None, 1.0)
+        self.assertEqual(self.storage.fetch_latest_record('alice', 'book.epub')['progress'], 'page:5')
+
+
+class FakeRequest:
+    def __init__(self, body, headers):
+        self.rfile = io.BytesIO(body)
+        self.wfile = io.BytesIO()
+        self.headers = headers
+        self.status = None
+
+    def send_response(self, status):
+        self.status = status
+
+    def send_header(self, name, value):
+        pass
+
+    def end_headers(self):
+        pass
+
+
+class TestKoReaderSyncBodyParsing(unittest.TestCase):
+    def _parse(self, body, headers):
+        from controllers.koreader_sync import KoReaderSyncController
+        controller = KoReaderSyncController.__new__(KoReaderSyncController)
+        controller.request = FakeRequest(body, headers)
+        return controller._parse_json_body(), controller.request
+
+    def test_rejects_oversized_body_without_reading_it(self):
+        payload, request = self._parse(b'{}', {'Content-Length': str(10 * 1024 * 1024)})
+        self.assertIsNone(payload)
+        self.assertEqual(request.status, 400)
+        self.assertEqual(request.rfile.tell(), 0)
+
+    def test_rejects_truncated_body(self):
+        payload, request = self._parse(b'{"a"', {'Content-Length': '10'})
+        self.assertIsNone(payload)
+        self.assertEqual(request.status, 400)
+
+    def test_parses_body(self):
+        payload, _ = self._parse(b'{"a": 1}', {'Content-Length': '8'})
+        self.assertEqual(payload, {'a': 1})
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,8 @@
 import http.client
 import importlib
+import io
 import os
+import shutil
 import socketserver
 import sys
 import tempfile
@@ -9,11 +11,14 @@ import time
 import unittest
 import xml.etree.ElementTree as ET
 import zipfile
+from urllib.parse import unquote
+from xml.sax.saxutils import escape as xml_escape
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
+
 def create_epub(path, title, author, date=None):
         container_xml = """<?xml version='1.0' encoding='UTF-8'?>
 <container version='1.0' xmlns='urn:oasis:names:tc:opendocument:xmlns:container'>
@@ -42,19 +47,41 @@ def create_epub(path, title, author, date=None):
                 zf.writestr('META-INF/container.xml', container_xml)
                 zf.writestr('content.opf', opf_template.format(title=title, author=author))
 
+
+class StubRequestHandler:
+    """Records what an OPDSController writes, for tests that skip the HTTP server."""
+
+    def __init__(self):
+        self.headers = {}
+        self.wfile = io.BytesIO()
+
+    def send_response(self, code):
+        self.status = code
+
+    def send_header(self, name, value):
+        pass
+
+    def end_headers(self):
+        pass
+
+
 class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     allow_reuse_address = True
 
+
 class TestOPDSCatalog(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         cls._orig_env = {
             'LIBRARY_DIR': os.environ.get('LIBRARY_DIR'),
             'PAGE_SIZE': os.environ.get('PAGE_SIZE'),
+            'METADATA_CACHE_DB_PATH': os.environ.get('METADATA_CACHE_DB_PATH'),
         }
         cls.library_dir = tempfile.TemporaryDirectory()
+        cls.cache_dir = tempfile.TemporaryDirectory()
         os.environ['LIBRARY_DIR'] = cls.library_dir.name
         os.environ['PAGE_SIZE'] = '1'
+        os.environ['METADATA_CACHE_DB_PATH'] = os.path.join(cls.cache_dir.name, 'metadata_cache.db')
         # Reload order to keep class identity consistent across routes/server
         importlib.reload(importlib.import_module('controllers.opds'))
         importlib.reload(importlib.import_module('routes'))
@@ -80,6 +107,7 @@ class TestOPDSCatalog(unittest.TestCase):
         cls.httpd.server_close()
         cls.thread.join(timeout=1)
         cls.library_dir.cleanup()
+        cls.cache_dir.cleanup()
         for key, value in cls._orig_env.items():
             if value is None:
                 os.environ.pop(key, None)
@@ -232,5 +260,283 @@ class TestOPDSCatalog(unittest.TestCase):
         self.assertEqual(len(entries), 1)
         self.assertEqual(entries[0].find('atom:title', ns).text, 'Alpha Title')
 
+    def test_feed_etag_allows_conditional_get(self):
+        status, headers, body = self._get('/opds/books?page=1')
+        self.assertEqual(status, 200)
+        etag = headers.get('ETag')
+        self.assertTrue(etag)
+        conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+        conn.request('GET', '/opds/books?page=1', headers={'If-None-Match': etag})
+        response = conn.getresponse()
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.read(), b'')
+        self.assertEqual(response.getheader('ETag'), etag)
+        conn.close()
+
+
+class TestLibraryIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._orig_env = {
+            'LIBRARY_DIR': os.environ.get('LIBRARY_DIR'),
+            'METADATA_CACHE_DB_PATH': os.environ.get('METADATA_CACHE_DB_PATH'),
+        }
+        cls.library_dir = tempfile.TemporaryDirectory()
+        cls.cache_dir = tempfile.TemporaryDirectory()
+        os.environ['LIBRARY_DIR'] = cls.library_dir.name
+        os.environ['METADATA_CACHE_DB_PATH'] = os.path.join(cls.cache_dir.name, 'metadata_cache.db')
+        cls.opds = importlib.reload(importlib.import_module('controllers.opds'))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.library_dir.cleanup()
+        cls.cache_dir.cleanup()
+        for key, value in cls._orig_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        importlib.reload(importlib.import_module('controllers.opds'))
+
+    def setUp(self):
+        self.root = self.library_dir.name
+        self.addCleanup(self._empty_library)
+        self.zeta_path = os.path.join(self.root, 'zeta.epub')
+        create_epub(self.zeta_path, 'Zeta Title', 'Zed Author', date='2021-03-01')
+        self.alpha_path = os.path.join(self.root, 'Nested', 'alpha.epub')
+        create_epub(self.alpha_path, 'Alpha Title', 'Ann Author', date='2020-05-05')
+        self.scanner = self.opds.BookScanner()
+
+    def _empty_library(self):
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+    def test_index_columns_and_groups(self):
+        index = self.scanner.get_library_index()
+        self.assertEqual(len(index), 2)
+        # Catalog order is by file name, case insensitive
+        self.assertEqual(index.titles, ['Alpha Title', 'Zeta Title'])
+        self.assertEqual(index.relative_paths, [os.path.join('Nested', 'alpha.epub'), 'zeta.epub'])
+        self.assertEqual(index.search_authors, ['ann author', 'zed author'])
+        self.assertEqual(index.year_positions, {'2020': [0], '2021': [1]})
+        self.assertEqual(index.year_counts, [('2021', 1), ('2020', 1)])
+        self.assertEqual(index.author_counts, [('Ann Author', 1), ('Zed Author', 1)])
+        self.assertEqual(index.authors_by_letter, {'A': [('Ann Author', 1)], 'Z': [('Zed Author', 1)]})
+        book = index.book(1)
+        self.assertEqual(book['path'], self.zeta_path)
+        self.assertEqual(book['author'], 'Zed Author')
+        self.assertEqual(book['year'], '2021')
+        self.assertEqual([b['title'] for b in index.slice(1, 10)], ['Zeta Title'])
+
+    def test_refresh_detects_added_modified_and_removed_books(self):
+        index = self.scanner.get_library_index()
+        self.assertFalse(self.scanner.refresh_library_index())
+        self.assertIs(self.scanner.get_library_index(), index)
+
+        beta_path = os.path.join(self.root, 'beta.epub')
+        create_epub(beta_path, 'Beta Title', 'Bob Author')
+        feed_key = (self.scanner.cache_generation, '/opds/books?page=1')
+        self.scanner.feed_cache.set(feed_key, (b'stale', '"etag"'))
+        self.assertTrue(self.scanner.refresh_library_index())
+        self.assertIn('Beta Title', self.scanner.get_library_index().titles)
+        self.assertIsNone(self.scanner.feed_cache.get(feed_key))
+
+        # Same path and size, new content: only the mtime reveals the change
+        create_epub(beta_path, 'Beta Redux', 'Bob Author')
+        os.utime(beta_path, ns=(1, 1))
+        self.assertTrue(self.scanner.refresh_library_index())
+        titles = self.scanner.get_library_index().titles
+        self.assertIn('Beta Redux', titles)
+        self.assertNotIn('Beta Title', titles)
+
+        os.remove(beta_path)
+        self.assertTrue(self.scanner.refresh_library_index())
+        self.assertEqual(self.scanner.get_library_index().titles, ['Alpha Title', 'Zeta Title'])
+
+    def test_feed_escapes_special_characters(self):
+        title = 'Tom & Jerry <"Best"> l\'intégrale'
+        author = 'O\'Brien & "Sons" <ed.>'
+        file_name = 'Tom & Jerry <"1"> l\'intégrale.epub'
+        create_epub(
+            os.path.join(self.root, file_name),
+            xml_escape(title, {'"': '&quot;', "'": '&apos;'}),
+            xml_escape(author, {'"': '&quot;', "'": '&apos;'}),
+        )
+        controller = self.opds.OPDSController(None)
+        controller.book_scanner = self.scanner
+        index = self.scanner.get_library_index()
+        entries = controller._create_book_entries(index.books(range(len(index))))
+        links = [('self', '/opds/search?q=a&b="c"<d>', 'application/atom+xml')]
+        body = self.opds.OPDSFeedGenerator.generate_feed(title, 'urn:test', links, entries)
+
+        xml_text = body.decode('utf-8').split('\n', 1)[1]
+        feed = ET.fromstring(xml_text)
+        ns = {'atom': 'http://www.w3.org/2005/Atom'}
+        self.assertEqual(feed.find('atom:title', ns).text, title)
+        self.assertEqual(feed.find('atom:link', ns).get('href'), '/opds/search?q=a&b="c"<d>')
+        entry = next(e for e in feed.findall('atom:entry', ns) if e.find('atom:title', ns).text == title)
+        self.assertEqual(entry.find('atom:author/atom:name', ns).text, author)
+        href = entry.find('atom:link', ns).get('href')
+        self.assertEqual(unquote(href[len('/download/'):]), file_name)
+
+    def test_recent_books_follow_symlinked_folders_inside_library(self):
+        outside_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(outside_dir.cleanup)
+        create_epub(os.path.join(outside_dir.name, 'outside.epub'), 'Outside', 'Nobody')
+        os.symlink(os.path.join(self.root, 'Nested'), os.path.join(self.root, 'Shelf'))
+        os.makedirs(os.path.join(self.root, 'A', 'B', 'C'))
+        os.symlink(os.path.join(self.root, 'Nested'), os.path.join(self.root, 'A', 'B', 'C', 'deep'))
+        os.symlink(outside_dir.name, os.path.join(self.root, 'Outside'))
+        os.symlink(self.root, os.path.join(self.root, 'Nested', 'loop'))
+
+        recent = self.scanner.scan_recent_books(self.root)
+
+        relative_paths = {book['relative_path'] for book in recent}
+        self.assertTrue(
+            {'zeta.epub', 'Nested/alpha.epub', 'Shelf/alpha.epub', 'A/B/C/deep/alpha.epub'} <= relative_paths
+        )
+        self.assertFalse(any('outside.epub' in path for path in relative_paths))
+
+    def test_feed_built_before_refresh_is_not_served_after_it(self):
+        feed_path = '/opds/books?page=1'
+        request = StubRequestHandler()
+        controller = self.opds.OPDSController(request)
+        controller.book_scanner = self.scanner
+        self.assertFalse(controller._send_cached_feed(feed_path, 'acquisition'))
+
+        # The watcher swaps the index while the request is still building its feed
+        create_epub(os.path.join(self.root, 'beta.epub'), 'Beta Title', 'Bob Author')
+        self.assertTrue(self.scanner.refresh_library_index())
+        controller._send_feed_and_cache(feed_path, b'stale', 'acquisition')
+        self.assertEqual(request.wfile.getvalue(), b'stale')
+
+        next_controller = self.opds.OPDSController(StubRequestHandler())
+        next_controller.book_scanner = self.scanner
+        self.assertFalse(next_controller._send_cached_feed(feed_path, 'acquisition'))
+
+    def test_concurrent_first_requests_share_one_build(self):
+        builds = []
+        build = self.scanner._build_library_index
+
+        def slow_build(*args):
+            builds.append(1)
+            time.sleep(0.05)
+            return build(*args)
+
+        self.scanner._build_library_index = slow_build
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.scanner.get_library_index()))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(len({id(index) for index in results}), 1)
+
+
+class TestMetadataCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        from controllers.opds import MetadataCache
+        self.cache = MetadataCache(os.path.join(self.tmp_dir.name, 'cache.db'))
+        self.epub_path = os.path.join(self.tmp_dir.name, 'book.epub')
+
+    def test_cached_metadata_is_refreshed_when_file_changes(self):
+        create_epub(self.epub_path, 'First Title', 'Author One', date='2020-01-01')
+        self.assertEqual(
+            self.cache.extract_epub_metadata(self.epub_path),
+            ('First Title', 'Author One', '2020-01-01'),
+        )
+        create_epub(self.epub_path, 'Second Title', 'Author One', date='2020-01-01')
+        os.utime(self.epub_path, ns=(1, 1))
+        self.assertEqual(self.cache.extract_epub_metadata(self.epub_path)[0], 'Second Title')
+
+    def test_locates_cover_inside_archive(self):
+        opf = """<?xml version='1.0' encoding='UTF-8'?>
+<package xmlns='http://www.idpf.org/2007/opf' version='3.0'>
+    <metadata xmlns:dc='http://purl.org/dc/elements/1.1/'><dc:title>Cover</dc:title></metadata>
+    <manifest>
+        <item id='cover' href='images/cover.png' media-type='image/png' properties='cover-image'/>
+    </manifest>
+</package>
+"""
+        with zipfile.ZipFile(self.epub_path, 'w') as zf:
+            zf.writestr('META-INF/container.xml', """<?xml version='1.0' encoding='UTF-8'?>
+<container version='1.0' xmlns='urn:oasis:names:tc:opendocument:xmlns:container'>
+    <rootfiles><rootfile full-path='OEBPS/content.opf' media-type='application/oebps-package+xml'/></rootfiles>
+</container>
+""")
+            zf.writestr('OEBPS/content.opf', opf)
+            zf.writestr('OEBPS/images/cover.png', b'png-bytes' * 1000, compress_type=zipfile.ZIP_DEFLATED)
+        cover_path, mime_type, entry = self.cache.locate_epub_cover(self.epub_path)
+        self.assertEqual((cover_path, mime_type), ('OEBPS/images/cover.png', 'image/png'))
+        # Served from the cache on the second call
+        self.assertEqual(self.cache.locate_epub_cover(self.epub_path), (cover_path, mime_type, entry))
+
+        from controllers.opds import BookMetadata
+        self.assertEqual(b''.join(BookMetadata.iter_zip_entry(self.epub_path, entry)), b'png-bytes' * 1000)
+
+    def test_batch_writes_are_persisted_on_exit(self):
+        create_epub(self.epub_path, 'Batched', 'Author One')
+        with self.cache.batch_writes():
+            self.assertEqual(self.cache.extract_epub_metadata(self.epub_path)[0], 'Batched')
+            count = self.cache._conn.execute('SELECT COUNT(*) FROM books').fetchone()[0]
+            self.assertEqual(count, 0)
+        count = self.cache._conn.execute('SELECT COUNT(*) FROM books').fetchone()[0]
+        self.assertEqual(count, 1)
+
+    def test_failed_batch_commit_does_not_leave_transaction_open(self):
+        conn = self.cache._conn
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.execute('CREATE TABLE parent (id INTEGER PRIMARY KEY)')
+        conn.execute('CREATE TABLE child (parent_id INTEGER REFERENCES parent(id) DEFERRABLE INITIALLY DEFERRED)')
+        # The deferred foreign key violation only surfaces at COMMIT
+        conn.execute('CREATE TRIGGER fail_commit AFTER INSERT ON books BEGIN INSERT INTO child VALUES (42); END')
+        create_epub(self.epub_path, 'Batched', 'Author One')
+        with self.cache.batch_writes():
+            self.cache.extract_epub_metadata(self.epub_path)
+        self.assertFalse(conn.in_transaction)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM books').fetchone()[0], 0)
+
+        conn.execute('DROP TRIGGER fail_commit')
+        other_path = os.path.join(self.tmp_dir.name, 'other.epub')
+        create_epub(other_path, 'Other', 'Author Two')
+        self.cache.extract_epub_metadata(other_path)
+        self.assertFalse(conn.in_transaction)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM books').fetchone()[0], 1)
+
+    def test_missing_file_returns_empty_metadata(self):
+        missing = os.path.join(self.tmp_dir.name, 'missing.epub')
+        self.assertEqual(self.cache.extract_epub_metadata(missing), (None, None, None))
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_evicts_least_recently_used_entry(self):
+        from controllers.cache import TTLCache
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_expired_entries_are_dropped(self):
+        from controllers.cache import TTLCache
+        cache = TTLCache(maxsize=2, ttl=0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+
 if __name__ == '__main__':
     unittest.main()